@@ -1,11 +1,8 @@
 import asyncio
 import json
-import logging
 import math
 import os
-import platform
 import random
-import signal
 import time
 
 import httpx
@@ -15,17 +12,22 @@ import yfinance
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
-from uvicorn import Config, Server
-
-logger = logging.getLogger("my_app")
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    fmt="%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+from uvicorn import Config
+
+from jobs import add_job
+from logger import setup_logger
+from loop_monitor import monitor
+from metrics import (
+    MetricsMiddleware,
+    loop_endpoint,
+    metrics_endpoint,
+    upstream_errors,
+    upstream_seconds,
 )
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.propagate = False
+from profiler import profile_endpoint, register_profile_signal
+from shutdown import DrainingServer, DrainMiddleware, ShutdownCoordinator
+
+logger = setup_logger("my_app")
 
 sui_url: str | None = os.getenv("SUI_URL")
 sui_token: str | None = os.getenv("SUI_TOKEN")
@@ -64,11 +66,20 @@ MAPPING: dict[str, dict[str, str]] = {
 }
 
 sui_session = httpx.AsyncClient()
+sui_latency = upstream_seconds.labels("sui")
+sui_errors = upstream_errors.labels("sui")
+yfinance_latency = upstream_seconds.labels("yfinance")
 tickers = yfinance.Tickers(f"{STOCKS} {INDICES} {CRYPTOS} {CURRENCIES} {COMMODITIES}")
 
 last_updated_time: float = time.time()
 
 app = FastAPI()
+coordinator = ShutdownCoordinator()
+app.add_middleware(DrainMiddleware, coordinator=coordinator)
+app.add_middleware(MetricsMiddleware)
+app.add_api_route("/metrics", metrics_endpoint)
+app.add_api_route("/debug/loop", loop_endpoint)
+app.add_api_route("/debug/profile", profile_endpoint)
 NO_CACHE_HEADER: dict[str, str] = {
     "Content-Type": "application/json",
     "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
@@ -140,9 +151,16 @@ def format_bytes(bytes: int, decimal_place: int = 2) -> str:
 
 
 async def get_sui_json_response(path_suffix: str) -> dict:
-    return (
-        await sui_session.get(SUI_URL + path_suffix, headers={"token": SUI_TOKEN})
-    ).json()
+    with sui_latency.time():
+        try:
+            response = await sui_session.get(
+                SUI_URL + path_suffix, headers={"token": SUI_TOKEN}
+            )
+        except Exception:
+            sui_errors.inc()
+            raise
+
+    return response.json()
 
 
 async def get_sui_status() -> dict[str, str]:
@@ -183,7 +201,8 @@ async def update_sui_status() -> None:
 
 
 def get_ticker_prices(symbol: str) -> tuple[float, float]:
-    info = tickers.tickers[symbol].history(period="5d", interval="60m")
+    with yfinance_latency.time():
+        info = tickers.tickers[symbol].history(period="5d", interval="60m")
 
     latest_time: pandas.Timestamp = info.index.max()
     close_value = info.at[latest_time, "Close"]
@@ -269,24 +288,28 @@ def save_status() -> None:
 
 async def start_api_server() -> None:
     config = Config(app=app, host="0.0.0.0", port=80, log_level="critical")
-    await Server(config).serve()
+    await DrainingServer(config, coordinator).serve()
 
 
 def schedule_yfinance_updates() -> None:
     scheduler = AsyncIOScheduler()
     interval = 60 // len(MAPPING)
 
-    scheduler.add_job(
+    add_job(
+        scheduler,
         save_status,
         "cron",
         hour=10,
         minute=24,
     )
 
+    # yfinance blocks on the network, so each update runs on the job thread pool
     for i, symbol in enumerate(MAPPING.keys()):
-        scheduler.add_job(
+        add_job(
+            scheduler,
             update_status,
             "cron",
+            name=f"update_status({symbol})",
             minute=i * interval,
             kwargs={"symbols": symbol},
         )
@@ -294,25 +317,19 @@ def schedule_yfinance_updates() -> None:
     scheduler.start()
 
 
-def handle_termination_signal() -> None:
+def save_status_on_exit() -> None:
     save_status()
     logger.info("All status saved before exiting")
-    raise SystemExit(0)
 
 
 async def main() -> None:
     load_cache()
 
-    match platform.system():
-        case "Linux":
-            asyncio.get_running_loop().add_signal_handler(
-                signal.SIGTERM, handle_termination_signal
-            )
-            logger.info("Signal handler for SIGTERM is registered.")
-
-        case _:
-            logger.info("Signal handler registration skipped.")
+    # SIGTERM drains in-flight requests before the status is saved
+    coordinator.on_shutdown(save_status_on_exit)
 
+    monitor.start()
+    register_profile_signal()
     logger.info("API server started")
 
     schedule_yfinance_updates()
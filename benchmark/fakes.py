@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+from wire import Request, build_response, read_request
+
+logger = logging.getLogger("my_app")
+
+# Stand-ins for the external APIs the services call, one port per upstream:
+#   sui       S-UI /apiv2/* and the dashboard pages shadowgate forwards to
+#   mitce     Subscription configs, with the subscription-userinfo header
+#   scrapedo  scrape.do, returning a novel page whose chapter keeps advancing
+#   telegram  Bot API methods, including long polling getUpdates
+#   bark      Bark push
+# apiserver's Yahoo calls go through yfinance, which cannot be pointed
+# elsewhere, so only its S-UI side runs offline
+UPSTREAM_PORTS: dict[str, int] = {
+    "sui": 0,
+    "mitce": 1,
+    "scrapedo": 2,
+    "telegram": 3,
+    "bark": 4,
+}
+
+Response = tuple[int, dict[str, str], bytes]
+JSON_HEADER: dict[str, str] = {"Content-Type": "application/json"}
+
+
+@dataclass
+class Behaviour:
+    latency: float  # Mean added delay in seconds
+    jitter: float
+    error_rate: float
+    payload_size: int  # Bytes for pages, configs and padding
+    clients: int  # Number of S-UI clients and inbounds
+    inbound_port: int  # Port every fake VLESS inbound points to
+    chapter_interval: float  # Seconds between new chapters on scrape.do
+
+
+def padding(size: int) -> str:
+    return ("x" * 63 + "\n") * (size // 64) + "x" * (size % 64)
+
+
+def json_response(content: object, status: int = 200) -> Response:
+    return status, JSON_HEADER, json.dumps(content).encode()
+
+
+def client_uuid(index: int) -> str:
+    # The first 13 characters are what shadowgate compares in config requests
+    return f"{index:08d}-0000-4000-8000-000000000000"
+
+
+def sui(request: Request, behaviour: Behaviour) -> Response:
+    ids = range(1, behaviour.clients + 1)
+
+    match request.path.partition("/apiv2/")[2]:
+        case "load":
+            return json_response(
+                {
+                    "success": True,
+                    "obj": {
+                        "inbounds": [{"id": i} for i in ids],
+                        "clients": [{"id": i, "enable": True} for i in ids],
+                    },
+                }
+            )
+        case "inbounds":
+            inbounds = [
+                {
+                    "id": i,
+                    "tag": "VLESS",
+                    "listen_port": behaviour.inbound_port,
+                    "transport": {"path": f"/ws{i}"},
+                }
+                for i in ids
+            ]
+            return json_response({"success": True, "obj": {"inbounds": inbounds}})
+        case "clients":
+            clients = [
+                {
+                    "id": i,
+                    "config": {"vless": {"name": f"user{i}", "uuid": client_uuid(i)}},
+                }
+                for i in ids
+            ]
+            return json_response({"success": True, "obj": {"clients": clients}})
+        case "onlines":
+            users = [f"user{i}" for i in ids if i % 3 == 0]
+            return json_response({"success": True, "obj": {"user": users}})
+        case "status":
+            received: int = int(time.time() * 1024)
+            return json_response(
+                {"success": True, "obj": {"net": {"recv": received, "sent": received}}}
+            )
+        case _:
+            # Anything else is a dashboard page
+            page = f"<html><body><pre>{padding(behaviour.payload_size)}</pre></body>"
+            return 200, {"Content-Type": "text/html"}, f"{page}</html>".encode()
+
+
+def request_params(request: Request) -> dict:
+    # The Bot API accepts query strings, JSON bodies and form bodies alike
+    params: dict = dict(request.query)
+    content_type: str = request.headers.get("content-type", "")
+
+    if "json" in content_type:
+        params.update(json.loads(request.body or b"{}"))
+    elif "form-urlencoded" in content_type:
+        params.update(parse_qsl(request.body.decode()))
+
+    return params
+
+
+def mitce(request: Request, behaviour: Behaviour) -> Response:
+    headers: dict[str, str] = {
+        "Content-Type": "text/plain",
+        "subscription-userinfo": "upload=0; download=0; total=107374182400; expire=0",
+    }
+    app: str = request.query.get("app", "unknown")
+    return 200, headers, f"# {app}\n{padding(behaviour.payload_size)}".encode()
+
+
+def scrapedo(request: Request, behaviour: Behaviour) -> Response:
+    chapter: int = int(time.time() // behaviour.chapter_interval) % 100000
+    page: str = (
+        "<html><body>"
+        f'<div class="latest-chapter"><a href="{request.query.get("url", "")}">'
+        f"第{chapter}章 Chapter {chapter}</a></div>"
+        f"<div>{padding(behaviour.payload_size)}</div></body></html>"
+    )
+    return 200, {"Content-Type": "text/html; charset=utf-8"}, page.encode()
+
+
+async def telegram(request: Request, behaviour: Behaviour) -> Response:
+    method: str = request.path.rsplit("/", 1)[-1]
+    message = {
+        "message_id": random.randint(1, 1 << 30),
+        "date": int(time.time()),
+        "chat": {"id": 1, "type": "private"},
+        "text": "",
+    }
+
+    match method:
+        case "getMe":
+            result: object = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Fake",
+                "username": "fake_bot",
+            }
+        case "getUpdates":
+            # Long polling returns nothing, but holds the request like Telegram
+            try:
+                timeout = float(request_params(request).get("timeout", 0))
+            except ValueError:
+                timeout = 0.0
+            await asyncio.sleep(min(timeout, 10.0))
+            result = []
+        case "sendMessage" | "editMessageText":
+            result = message
+        case _:
+            result = True
+
+    return json_response({"ok": True, "result": result})
+
+
+def bark(request: Request, behaviour: Behaviour) -> Response:
+    return json_response(
+        {"code": 200, "message": "success", "timestamp": int(time.time())}
+    )
+
+
+HANDLERS: dict[str, Callable] = {
+    "sui": sui,
+    "mitce": mitce,
+    "scrapedo": scrapedo,
+    "telegram": telegram,
+    "bark": bark,
+}
+
+
+def error_response(name: str) -> Response:
+    if name == "telegram":
+        return json_response(
+            {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            },
+            status=429,
+        )
+    return json_response({"message": "Injected failure"}, status=503)
+
+
+async def handle_connection(
+    name: str,
+    behaviour: Behaviour,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    handler = HANDLERS[name]
+
+    try:
+        while (request := await read_request(reader)) is not None:
+            delay: float = random.gauss(behaviour.latency, behaviour.jitter)
+            await asyncio.sleep(max(0.0, delay))
+
+            if random.random() < behaviour.error_rate:
+                status, headers, body = error_response(name)
+            else:
+                result = handler(request, behaviour)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                status, headers, body = result
+
+            writer.write(build_response(status, headers, body))
+            await writer.drain()
+
+            if request.headers.get("connection", "").lower() == "close":
+                break
+
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+
+    finally:
+        writer.close()
+
+
+async def serve(
+    names: list[str], host: str, base_port: int, behaviour: Behaviour
+) -> None:
+    servers: list[asyncio.Server] = []
+
+    for name in names:
+        port: int = base_port + UPSTREAM_PORTS[name]
+        server = await asyncio.start_server(
+            lambda r, w, name=name: handle_connection(name, behaviour, r, w),
+            host,
+            port,
+        )
+        servers.append(server)
+        logger.info(f"Fake {name} listening on http://{host}:{port}")
+
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline stand-in upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=9000)
+    parser.add_argument(
+        "--only", nargs="*", choices=list(HANDLERS), default=list(HANDLERS)
+    )
+    parser.add_argument("--latency", type=float, default=20.0, help="Mean delay in ms")
+    parser.add_argument("--jitter", type=float, default=5.0, help="Delay spread in ms")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Failure ratio, 0 to 1"
+    )
+    parser.add_argument("--payload-size", type=int, default=16 * 1024)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument(
+        "--inbound-port",
+        type=int,
+        default=9100,
+        help="Port announced for every VLESS inbound, e.g. the tunnel echo backend",
+    )
+    parser.add_argument("--chapter-interval", type=float, default=3600.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    args = parse_args()
+
+    behaviour = Behaviour(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        payload_size=args.payload_size,
+        clients=args.clients,
+        inbound_port=args.inbound_port,
+        chapter_interval=args.chapter_interval,
+    )
+
+    try:
+        asyncio.run(serve(args.only, args.host, args.base_port, behaviour))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from wire import build_request, read_response
+
+# Typical run, with the services pointed at benchmark/fakes.py:
+#   python fakes.py --latency 20 --error-rate 0.01
+#   SUI_URL=http://127.0.0.1:9000 ... uv run main.py   (in apiserver/)
+#   python run.py apiserver --url http://127.0.0.1:80 --save baseline.json
+#   python run.py apiserver --url http://127.0.0.1:80 --compare baseline.json
+# novel reads SCRAPER_URL, TELEGRAM_API_URL and BARK_URL, shadowgate reads
+# PROXY_HOST/PROXY_PORT for S-UI and MITCE_URL, telebot TELEGRAM_API_URL.
+# apiserver's /capital and /exchange still need Yahoo, yfinance has no
+# override for its hosts, so only the cached responses are measured offline.
+
+# Hot endpoints per service. Paths may use {proxy_path}, and requests marked
+# revalidate send the last ETag seen for their path.
+SCENARIOS: dict[str, list[dict]] = {
+    "apiserver": [
+        {"path": "/capital"},
+        {"path": "/exchange"},
+        {"path": "/sui"},
+        {"path": "/health"},
+    ],
+    "novel": [
+        {"path": "/update"},
+        {"path": "/update", "revalidate": True},
+        {"path": "/health"},
+    ],
+    "shadowgate": [
+        {"path": "{proxy_path}/"},
+        {
+            "path": "/conf/?name=user1&uuid=00000001-0000&file=config.yaml"
+            "&location=bench&provider=yidong",
+            "headers": {"User-Agent": "clash-verge"},
+        },
+        {"path": "/metrics"},
+    ],
+}
+
+
+@dataclass
+class Results:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    statuses: dict[int, int] = field(default_factory=dict)
+    errors: int = 0
+    bytes: int = 0
+    etags: dict[str, str] = field(default_factory=dict)
+
+
+def quantile(values: list[float], q: float) -> float:
+    if not values:
+        return math.nan
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def worker(
+    host: str,
+    port: int,
+    host_header: str,
+    requests: list[dict],
+    deadline: float,
+    results: Results,
+    offset: int,
+) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    index: int = offset
+
+    try:
+        while time.perf_counter() < deadline:
+            spec: dict = requests[index % len(requests)]
+            index += 1
+
+            path: str = spec["path"]
+            headers: dict[str, str] = dict(spec.get("headers", {}))
+            if spec.get("revalidate") and path in results.etags:
+                headers["If-None-Match"] = results.etags[path]
+
+            start_time: float = time.perf_counter()
+            try:
+                writer.write(build_request("GET", path, host_header, headers))
+                await writer.drain()
+                status, response_headers, body = await read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                # Reconnect and carry on, the failure counts as an error
+                results.errors += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+
+            key: str = f"{path} (revalidate)" if "If-None-Match" in headers else path
+            results.latencies.setdefault(key, []).append(
+                time.perf_counter() - start_time
+            )
+            results.statuses[status] = results.statuses.get(status, 0) + 1
+            results.bytes += len(body)
+            results.errors += status >= 500
+
+            if etag := response_headers.get("etag"):
+                results.etags[path] = etag
+
+            if response_headers.get("connection", "").lower() == "close":
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+
+    finally:
+        writer.close()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    target = urlsplit(args.url)
+    host: str = target.hostname or "127.0.0.1"
+    port: int = target.port or 80
+    host_header: str = args.host or target.netloc
+
+    requests: list[dict] = [
+        spec | {"path": spec["path"].format(proxy_path=args.proxy_path)}
+        for spec in SCENARIOS[args.scenario]
+    ]
+
+    # /metrics is only served with the service's DEBUG_TOKEN
+    if args.debug_token:
+        for spec in requests:
+            spec["headers"] = spec.get("headers", {}) | {
+                "X-Debug-Token": args.debug_token
+            }
+
+    # Warm up connections, caches and ETags before measuring
+    warmup = Results()
+    warmup_deadline: float = time.perf_counter() + 1
+    await asyncio.gather(
+        *(
+            worker(host, port, host_header, requests, warmup_deadline, warmup, i)
+            for i in range(min(args.concurrency, 4))
+        )
+    )
+
+    results = Results(etags=warmup.etags)
+    start_time: float = time.perf_counter()
+    deadline: float = start_time + args.duration
+    await asyncio.gather(
+        *(
+            worker(host, port, host_header, requests, deadline, results, i)
+            for i in range(args.concurrency)
+        )
+    )
+    elapsed: float = time.perf_counter() - start_time
+
+    all_latencies: list[float] = sorted(
+        latency for values in results.latencies.values() for latency in values
+    )
+    report: dict = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "requests": len(all_latencies),
+        "errors": results.errors,
+        "throughput": len(all_latencies) / elapsed,
+        "megabytes_per_second": results.bytes / elapsed / 1024 / 1024,
+        "statuses": {str(k): v for k, v in sorted(results.statuses.items())},
+        "p50": quantile(all_latencies, 0.5),
+        "p99": quantile(all_latencies, 0.99),
+        "paths": {},
+    }
+
+    for path, values in sorted(results.latencies.items()):
+        values.sort()
+        report["paths"][path] = {
+            "requests": len(values),
+            "p50": quantile(values, 0.5),
+            "p99": quantile(values, 0.99),
+        }
+
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['scenario']}: {report['requests']} requests, "
+        f"{report['errors']} errors, {report['throughput']:.1f} req/s, "
+        f"{report['megabytes_per_second']:.2f} MB/s, "
+        f"p50 {report['p50'] * 1000:.2f}ms, p99 {report['p99'] * 1000:.2f}ms"
+    )
+    print(f"statuses: {report['statuses']}")
+
+    for path, stats in report["paths"].items():
+        print(
+            f"  {path:<50} {stats['requests']:>7} "
+            f"p50 {stats['p50'] * 1000:>8.2f}ms p99 {stats['p99'] * 1000:>8.2f}ms"
+        )
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput']:.1f} req/s "
+            f"vs {baseline['throughput']:.1f} req/s"
+        )
+
+    for key in ("p50", "p99"):
+        if report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(
+                f"{key} {report[key] * 1000:.2f}ms vs {baseline[key] * 1000:.2f}ms"
+            )
+
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drive a service's hot endpoints")
+    parser.add_argument("scenario", choices=list(SCENARIOS))
+    parser.add_argument("--url", default="http://127.0.0.1:80")
+    parser.add_argument("--host", help="Host header, e.g. shadowgate's HOST_DOMAIN")
+    parser.add_argument("--proxy-path", default="/dashboard")
+    parser.add_argument("--debug-token", help="DEBUG_TOKEN, needed for /metrics")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--save", help="Write the report as JSON to this file")
+    parser.add_argument("--compare", help="Fail when worse than this saved report")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="Allowed change, 0 to 1"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        sys.exit(1 if regressions else 0)
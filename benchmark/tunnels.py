@@ -0,0 +1,424 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from wire import (
+    OP_BINARY,
+    OP_CLOSE,
+    OP_PING,
+    OP_PONG,
+    build_frame,
+    build_request,
+    build_response,
+    read_frame,
+    read_request,
+    read_response,
+    websocket_accept,
+)
+
+logger = logging.getLogger("my_app")
+
+# Typical run, with benchmark/fakes.py announcing the echo port for every inbound:
+#   python fakes.py --only sui --clients 20 --inbound-port 9100
+#   PROXY_HOST=127.0.0.1 PROXY_PORT=9000 ... uv run main.py   (in shadowgate/)
+#   python tunnels.py --url ws://127.0.0.1:80 --pid <shadowgate pid> --save base.json
+# For a container, the pid is docker inspect -f '{{.State.Pid}}' shadowgate.
+# Every tunnel is also run straight against the echo backend first, so the
+# latency shadowgate adds is the difference between the two runs.
+
+# Frames carry their send time, so anything smaller cannot be timed
+TIMESTAMP = struct.Struct("!d")
+# A zero mask is valid and leaves payloads untouched, which keeps the load
+# generator cheap next to the relay it measures
+ZERO_MASK: bytes = b"\0\0\0\0"
+CLOSE_TIMEOUT: float = 5.0
+SETTLE_SECONDS: float = 1.0
+CLOCK_TICKS: int = os.sysconf("SC_CLK_TCK")
+
+
+@dataclass
+class Results:
+    latencies: list[float] = field(default_factory=list)
+    sent_bytes: int = 0
+    received_bytes: int = 0
+    frames: int = 0
+    errors: int = 0
+
+
+@dataclass
+class Tunnel:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+
+
+def quantile(values: list[float], q: float) -> float:
+    if not values:
+        return math.nan
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def echo_connection(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    # Stands in for the S-UI inbound, so no extensions are negotiated and the
+    # relay sees frames exactly as sent
+    try:
+        request = await read_request(reader)
+        key: str | None = request.headers.get("sec-websocket-key") if request else None
+
+        if key is None:
+            writer.write(build_response(400))
+            return
+
+        headers: dict[str, str] = {
+            "Upgrade": "websocket",
+            "Connection": "Upgrade",
+            "Sec-WebSocket-Accept": websocket_accept(key),
+        }
+        writer.write(build_response(101, headers))
+
+        while True:
+            fin, opcode, payload = await read_frame(reader)
+
+            if opcode == OP_CLOSE:
+                writer.write(build_frame(OP_CLOSE, payload[:2]))
+                break
+            elif opcode == OP_PING:
+                writer.write(build_frame(OP_PONG, payload))
+            elif opcode != OP_PONG:
+                writer.write(build_frame(opcode, payload, fin=fin))
+
+            await writer.drain()
+
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+
+    finally:
+        writer.close()
+
+
+async def open_tunnel(host: str, port: int, host_header: str, path: str) -> Tunnel:
+    reader, writer = await asyncio.open_connection(host, port)
+    key: str = base64.b64encode(os.urandom(16)).decode()
+
+    writer.write(
+        build_request(
+            "GET",
+            path,
+            host_header,
+            {
+                "Upgrade": "websocket",
+                "Connection": "Upgrade",
+                "Sec-WebSocket-Key": key,
+                "Sec-WebSocket-Version": "13",
+            },
+        )
+    )
+    await writer.drain()
+
+    status, headers, _ = await read_response(reader)
+    if status != 101 or headers.get("sec-websocket-accept") != websocket_accept(key):
+        writer.close()
+        raise ConnectionError(f"Handshake for {path} failed with status {status}")
+
+    return Tunnel(reader, writer)
+
+
+async def open_tunnels(url: str, host: str | None, args: argparse.Namespace) -> list:
+    target = urlsplit(url)
+    address: str = target.hostname or "127.0.0.1"
+    port: int = target.port or 80
+    host_header: str = host or target.netloc
+
+    # Paths cycle through the inbounds, /ws1 to /ws{paths} as fakes.py announces
+    handshakes = asyncio.Semaphore(args.handshake_concurrency)
+
+    async def open_one(index: int) -> Tunnel | BaseException:
+        async with handshakes:
+            try:
+                path: str = f"/ws{index % args.paths + 1}"
+                return await open_tunnel(address, port, host_header, path)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                return e
+
+    opened = await asyncio.gather(*(open_one(i) for i in range(args.tunnels)))
+    tunnels: list[Tunnel] = [t for t in opened if isinstance(t, Tunnel)]
+
+    if failures := [e for e in opened if not isinstance(e, Tunnel)]:
+        logger.warning(f"{len(failures)} tunnels failed to open, first: {failures[0]}")
+
+    return tunnels
+
+
+async def drive(
+    tunnel: Tunnel, args: argparse.Namespace, deadline: float, results: Results
+) -> None:
+    # Up to window frames are in flight per tunnel, optionally paced to rate
+    window = asyncio.Semaphore(args.window)
+    padding: bytes = bytes(args.frame_size - TIMESTAMP.size)
+    writer: asyncio.StreamWriter = tunnel.writer
+
+    async def send() -> None:
+        next_send: float = time.perf_counter()
+
+        while time.perf_counter() < deadline:
+            await window.acquire()
+
+            if args.rate:
+                next_send += 1 / args.rate
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+            payload: bytes = TIMESTAMP.pack(time.perf_counter()) + padding
+            writer.write(build_frame(OP_BINARY, payload, ZERO_MASK))
+            await writer.drain()
+            results.sent_bytes += len(payload)
+
+    async def receive() -> None:
+        while True:
+            _, opcode, payload = await read_frame(tunnel.reader)
+
+            if opcode == OP_CLOSE:
+                raise ConnectionError("Tunnel closed by the relay")
+            elif opcode == OP_PING:
+                writer.write(build_frame(OP_PONG, payload, ZERO_MASK))
+            elif opcode == OP_BINARY:
+                (sent_time,) = TIMESTAMP.unpack_from(payload)
+                results.latencies.append(time.perf_counter() - sent_time)
+                results.received_bytes += len(payload)
+                results.frames += 1
+                window.release()
+
+    async def drain_window() -> None:
+        # Holding every slot means every frame has come back
+        for _ in range(args.window):
+            await window.acquire()
+
+    receiver = asyncio.create_task(receive())
+    sender = asyncio.create_task(send())
+
+    try:
+        # A dead receiver would leave the sender waiting on the window forever
+        await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+
+        if sender.done():
+            sender.result()
+            drained = asyncio.create_task(drain_window())
+            await asyncio.wait(
+                [drained, receiver],
+                timeout=CLOSE_TIMEOUT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            drained.cancel()
+
+        if receiver.done():
+            receiver.result()
+
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        results.errors += 1
+
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        writer.close()
+
+
+def process_stats(pid: int | None) -> tuple[float, int]:
+    # CPU seconds and resident set size in KiB of the relay process
+    if pid is None:
+        return math.nan, 0
+
+    with open(f"/proc/{pid}/stat") as file:
+        fields: list[str] = file.read().rpartition(")")[2].split()
+    cpu_seconds: float = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    with open(f"/proc/{pid}/status") as file:
+        rss: int = next(
+            int(line.split()[1]) for line in file if line.startswith("VmRSS:")
+        )
+
+    return cpu_seconds, rss
+
+
+async def run_phase(
+    url: str, host: str | None, pid: int | None, args: argparse.Namespace
+) -> dict:
+    _, rss_before = process_stats(pid)
+    tunnels: list[Tunnel] = await open_tunnels(url, host, args)
+    await asyncio.sleep(SETTLE_SECONDS)
+    cpu_before, rss_after = process_stats(pid)
+
+    results = Results(errors=args.tunnels - len(tunnels))
+    start_time: float = time.perf_counter()
+    deadline: float = start_time + args.duration
+    await asyncio.gather(*(drive(t, args, deadline, results) for t in tunnels))
+    elapsed: float = time.perf_counter() - start_time
+
+    cpu_after, _ = process_stats(pid)
+    relayed: int = results.sent_bytes + results.received_bytes
+    results.latencies.sort()
+
+    return {
+        "tunnels": len(tunnels),
+        "frames": results.frames,
+        "errors": results.errors,
+        "frames_per_second": results.frames / elapsed,
+        "megabytes_per_second": relayed / elapsed / 1024 / 1024,
+        "p50": quantile(results.latencies, 0.5),
+        "p99": quantile(results.latencies, 0.99),
+        "cpu_seconds_per_gb": (cpu_after - cpu_before) / (relayed / 1e9 or math.nan),
+        "kb_per_tunnel": (rss_after - rss_before) / max(len(tunnels), 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    echo: asyncio.Server | None = None
+    if not args.external_echo:
+        echo = await asyncio.start_server(
+            echo_connection, args.echo_host, args.echo_port
+        )
+        logger.info(f"Echo backend listening on ws://{args.echo_host}:{args.echo_port}")
+
+    try:
+        direct = await run_phase(
+            f"ws://{args.echo_host}:{args.echo_port}", None, None, args
+        )
+        relayed = await run_phase(args.url, args.host, args.pid, args)
+    finally:
+        if echo is not None:
+            echo.close()
+
+    return {
+        "tunnels": args.tunnels,
+        "frame_size": args.frame_size,
+        "rate": args.rate,
+        "window": args.window,
+        "direct": direct,
+        "shadowgate": relayed,
+        "added_p50": relayed["p50"] - direct["p50"],
+        "added_p99": relayed["p99"] - direct["p99"],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['tunnels']} tunnels, {report['frame_size']} byte frames, "
+        f"rate {report['rate'] or 'unpaced'}, window {report['window']}"
+    )
+
+    for name in ("direct", "shadowgate"):
+        phase: dict = report[name]
+        print(
+            f"  {name:<10} {phase['tunnels']:>5} open, {phase['errors']} errors, "
+            f"{phase['frames_per_second']:.0f} frames/s, "
+            f"{phase['megabytes_per_second']:.2f} MB/s, "
+            f"p50 {phase['p50'] * 1000:.2f}ms, p99 {phase['p99'] * 1000:.2f}ms"
+        )
+
+    relayed: dict = report["shadowgate"]
+    print(
+        f"added latency p50 {report['added_p50'] * 1000:.2f}ms, "
+        f"p99 {report['added_p99'] * 1000:.2f}ms"
+    )
+    if math.isnan(relayed["cpu_seconds_per_gb"]):
+        print("cpu and memory need shadowgate's --pid")
+    else:
+        print(
+            f"cpu {relayed['cpu_seconds_per_gb']:.2f}s per GB, "
+            f"memory {relayed['kb_per_tunnel']:.1f} KiB per tunnel"
+        )
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    current: dict = report["shadowgate"]
+    previous: dict = baseline["shadowgate"]
+
+    if current["megabytes_per_second"] < previous["megabytes_per_second"] * (
+        1 - tolerance
+    ):
+        regressions.append(
+            f"throughput {current['megabytes_per_second']:.2f} MB/s "
+            f"vs {previous['megabytes_per_second']:.2f} MB/s"
+        )
+
+    # Added latency can be around zero or negative, so compare the relayed one
+    for key in ("p50", "p99"):
+        if current[key] > previous[key] * (1 + tolerance):
+            regressions.append(
+                f"{key} {current[key] * 1000:.2f}ms vs {previous[key] * 1000:.2f}ms"
+            )
+
+    # Only comparable when both runs were given the relay's pid
+    for key in ("cpu_seconds_per_gb", "kb_per_tunnel"):
+        if current[key] > previous[key] * (1 + tolerance) and previous[key] > 0:
+            regressions.append(f"{key} {current[key]:.2f} vs {previous[key]:.2f}")
+
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load shadowgate's WebSocket tunnels")
+    parser.add_argument("--url", default="ws://127.0.0.1:80")
+    parser.add_argument("--host", help="Host header sent to shadowgate")
+    parser.add_argument("--pid", type=int, help="shadowgate's pid for CPU and memory")
+    parser.add_argument("--echo-host", default="127.0.0.1")
+    parser.add_argument(
+        "--echo-port", type=int, default=9100, help="Match fakes.py --inbound-port"
+    )
+    parser.add_argument(
+        "--external-echo",
+        action="store_true",
+        help="Use an echo backend already listening instead of starting one",
+    )
+    parser.add_argument("--tunnels", type=int, default=100)
+    parser.add_argument(
+        "--paths", type=int, default=20, help="Match fakes.py --clients"
+    )
+    parser.add_argument(
+        "--frame-size", type=int, default=16 * 1024, help="Bytes, up to 1 MiB"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="Frames per second per tunnel, 0 is max"
+    )
+    parser.add_argument("--window", type=int, default=4, help="In flight per tunnel")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--handshake-concurrency", type=int, default=50)
+    parser.add_argument("--save", help="Write the report as JSON to this file")
+    parser.add_argument("--compare", help="Fail when worse than this saved report")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="Allowed change, 0 to 1"
+    )
+
+    args = parser.parse_args()
+    if args.frame_size < TIMESTAMP.size:
+        parser.error(f"--frame-size must be at least {TIMESTAMP.size}")
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        sys.exit(1 if regressions else 0)
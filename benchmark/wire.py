@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import hashlib
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl, urlsplit
+
+MAX_LINE_SIZE: int = 64 * 1024
+
+WEBSOCKET_GUID: bytes = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION: int = 0x0
+OP_TEXT: int = 0x1
+OP_BINARY: int = 0x2
+OP_CLOSE: int = 0x8
+OP_PING: int = 0x9
+OP_PONG: int = 0xA
+
+REASONS: dict[int, str] = {
+    101: "Switching Protocols",
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class Request:
+    method: str
+    target: str
+    headers: dict[str, str]
+    body: bytes = b""
+    path: str = field(init=False)
+    query: dict[str, str] = field(init=False)
+
+    def __post_init__(self) -> None:
+        parts = urlsplit(self.target)
+        self.path = parts.path
+        self.query = dict(parse_qsl(parts.query))
+
+
+async def read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+    headers: dict[str, str] = {}
+
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    return headers
+
+
+async def read_body(
+    reader: asyncio.StreamReader, headers: dict[str, str], until_close: bool = False
+) -> bytes:
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks: list[bytes] = []
+
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+        await read_headers(reader)  # Trailers
+        return b"".join(chunks)
+
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+
+    return await reader.read() if until_close else b""
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    request_line: bytes = await reader.readline()
+    if not request_line.strip():
+        return None
+
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = await read_headers(reader)
+    return Request(method, target, headers, await read_body(reader, headers))
+
+
+async def read_response(
+    reader: asyncio.StreamReader, method: str = "GET"
+) -> tuple[int, dict[str, str], bytes]:
+    status_line: bytes = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed before the response")
+
+    status: int = int(status_line.split(b" ", 2)[1])
+    headers = await read_headers(reader)
+
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        return status, headers, b""
+
+    return status, headers, await read_body(reader, headers, until_close=True)
+
+
+def build_response(
+    status: int, headers: dict[str, str] | None = None, body: bytes = b""
+) -> bytes:
+    lines: list[str] = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+    lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def build_request(
+    method: str, target: str, host: str, headers: dict[str, str] | None = None
+) -> bytes:
+    lines: list[str] = [f"{method} {target} HTTP/1.1", f"Host: {host}"]
+    lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def websocket_accept(key: str) -> str:
+    digest: bytes = hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()
+    return base64.b64encode(digest).decode()
+
+
+def apply_mask(payload: bytes, mask: bytes) -> bytes:
+    # XOR as one big integer, far quicker than a byte by byte loop
+    if not payload or mask == b"\0\0\0\0":
+        return payload
+
+    repeated: bytes = (mask * (len(payload) // 4 + 1))[: len(payload)]
+    masked: int = int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+    return masked.to_bytes(len(payload), "big")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    first, second = await reader.readexactly(2)
+    length: int = second & 0x7F
+
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+
+    mask: bytes | None = await reader.readexactly(4) if second & 0x80 else None
+    payload: bytes = await reader.readexactly(length)
+
+    if mask is not None:
+        payload = apply_mask(payload, mask)
+
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def build_frame(
+    opcode: int, payload: bytes = b"", mask: bytes | None = None, fin: bool = True
+) -> bytes:
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    mask_bit: int = 0x80 if mask is not None else 0
+    length: int = len(payload)
+
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += length.to_bytes(2, "big")
+    else:
+        header.append(mask_bit | 127)
+        header += length.to_bytes(8, "big")
+
+    if mask is None:
+        return bytes(header) + payload
+
+    return bytes(header) + mask + apply_mask(payload, mask)
@@ -0,0 +1,68 @@
+import logging
+import random
+import time
+
+logger = logging.getLogger("my_app")
+
+CLOSED: str = "closed"
+OPEN: str = "open"
+HALF_OPEN: str = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        base_delay: float = 60 * 30,
+        max_delay: float = 60 * 60 * 12,
+    ) -> None:
+        self.name: str = name
+        self.failure_threshold: int = failure_threshold
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+
+        self.state: str = CLOSED
+        self.failures: int = 0  # Consecutive failures while closed
+        self.trips: int = 0  # Consecutive openings without a success in between
+        self.retry_time: float = 0.0
+
+    def allows_request(self) -> bool:
+        if self.state == OPEN and time.monotonic() >= self.retry_time:
+            # Let a single trial request through after the backoff
+            self.state = HALF_OPEN
+            logger.info(f"Circuit for {self.name} is half-open")
+
+        return self.state != OPEN
+
+    def record_success(self) -> bool:
+        recovered: bool = self.state != CLOSED
+
+        if recovered:
+            logger.info(f"Circuit for {self.name} closed again")
+
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        return recovered
+
+    def record_failure(self) -> bool:
+        self.failures += 1
+
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+            return True
+
+        return False
+
+    def trip(self) -> None:
+        self.trips += 1
+        self.failures = 0
+        self.state = OPEN
+
+        # Exponential backoff with jitter so retries do not line up
+        delay: float = min(self.base_delay * 2 ** (self.trips - 1), self.max_delay)
+        delay *= random.uniform(0.8, 1.2)
+        self.retry_time = time.monotonic() + delay
+
+        logger.warning(f"Circuit for {self.name} opened for {delay:.0f} seconds")
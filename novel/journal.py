@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+from typing import TextIO
+
+logger = logging.getLogger("my_app")
+
+FSYNC_DELAY: float = 1.0  # Seconds to batch journal appends before syncing to disk
+
+
+# Append-only log of title changes, replayed on top of the last snapshot.
+# A snapshot rotates it first, so appends made while the snapshot is written
+# land in a fresh file and the rotated one is removed once the snapshot is safe.
+class TitleJournal:
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.rotated_path: str = f"{path}.old"
+        self.file: TextIO | None = None
+        self.sync_handle: asyncio.TimerHandle | None = None
+        self.sync_task: asyncio.Task | None = None
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, name: str, title: str, date: str) -> None:
+        if self.file is None:
+            self.open()
+        assert self.file is not None
+
+        self.file.write(json.dumps([name, title, date], ensure_ascii=False) + "\n")
+        self.file.flush()
+
+        # Group appends made close together into a single fsync
+        if self.sync_handle is None:
+            self.sync_handle = asyncio.get_running_loop().call_later(
+                FSYNC_DELAY, self.sync
+            )
+
+    def sync(self) -> None:
+        self.sync_handle = None
+
+        if self.file is None:
+            return
+
+        # fsync blocks for the length of a disk flush, so it runs in a thread
+        if self.sync_task is not None and not self.sync_task.done():
+            self.sync_handle = asyncio.get_running_loop().call_later(
+                FSYNC_DELAY, self.sync
+            )
+            return
+
+        self.sync_task = asyncio.create_task(
+            asyncio.to_thread(os.fsync, self.file.fileno())
+        )
+
+    def replay(self) -> list[tuple[str, str, str]]:
+        entries: list[tuple[str, str, str]] = []
+
+        # A rotated journal is left behind when a snapshot did not finish
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        name, title, date = json.loads(line)
+                        entries.append((name, title, date))
+                    except Exception:
+                        # A torn write can only be the last line
+                        logger.warning("Skipped a corrupted title journal entry")
+
+        return entries
+
+    async def rotate(self) -> None:
+        # The file is about to be closed, so let a running fsync finish first
+        while self.sync_task is not None and not self.sync_task.done():
+            await asyncio.wait([self.sync_task])
+
+        if self.sync_handle is not None:
+            self.sync_handle.cancel()
+            self.sync_handle = None
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        # Never overwrite entries an unfinished snapshot still depends on, the
+        # next snapshot covers both files as they are already in memory
+        if os.path.exists(self.path) and not os.path.exists(self.rotated_path):
+            os.rename(self.path, self.rotated_path)
+
+    def discard_rotated(self) -> None:
+        # Only called once a snapshot covering the rotated entries is durable
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
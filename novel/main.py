@@ -1,10 +1,8 @@
 import asyncio
+import hashlib
 import json
-import logging
 import os
-import platform
 import re
-import signal
 import time
 import tomllib
 from collections import deque
@@ -13,21 +11,30 @@ from datetime import datetime
 
 from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, JobExecutionEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse
 from httpx import AsyncClient, Timeout
 from selectolax.parser import HTMLParser
-from uvicorn import Config, Server
-
-logger = logging.getLogger("my_app")
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    fmt="%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+from uvicorn import Config
+
+from breaker import CircuitBreaker
+from jobs import add_job
+from journal import TitleJournal
+from logger import setup_logger
+from loop_monitor import monitor
+from metrics import (
+    MetricsMiddleware,
+    cache_requests,
+    loop_endpoint,
+    metrics_endpoint,
+    upstream_errors,
+    upstream_seconds,
 )
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.propagate = False
+from notifier import BarkSink, NotificationDispatcher, TelegramSink
+from shutdown import DrainingServer, DrainMiddleware, ShutdownCoordinator
+from sites import SITE_BACKENDS, Mirror, load_sites, rank_mirrors
+
+logger = setup_logger("my_app")
 
 bark_url: str | None = os.getenv("BARK_URL")
 scraper_key: str | None = os.getenv("SCRAPER_KEY")
@@ -48,31 +55,58 @@ else:
     TELEBOT_TOKEN: str = telebot_token
     TELEBOT_USER_ID: str = telebot_user_id
 
+# Overridable so the offline fakes in benchmark/ can stand in for both APIs
+SCRAPER_URL: str = os.getenv("SCRAPER_URL", "http://api.scrape.do/")
+TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
 BOOK_PATH: str = "/config/book.toml"
 BOOK_CACHE_PATH: str = "/cache/book_cache.json"
+BOOK_JOURNAL_PATH: str = "/cache/book_cache.journal"
 
 GEO_CODE: str = "JP"
-TARGETING_SITE: str = "oop"
 HEALTH_CHECK_TIMEOUT: int = 60 * 60 * 3  # 3 hours
+NOTIFY_FLUSH_TIMEOUT: float = 3.0
 
 
 @dataclass(frozen=True)
 class Book:
     name: str
-    url: str
+    mirrors: tuple[Mirror, ...]
 
 
 scheduler = AsyncIOScheduler()
+journal = TitleJournal(BOOK_JOURNAL_PATH)
+notifier = NotificationDispatcher(
+    [
+        TelegramSink(TELEBOT_TOKEN, TELEBOT_USER_ID, TELEGRAM_API_URL),
+        BarkSink(BARK_URL),
+    ]
+)
 
 books: list[Book] = []
 titles: dict[str, deque[tuple[str, str]]] = {}  # {book: deque[title, date]}
+book_urls: dict[str, str] = {}  # {book: url of the mirror last fetched from}
+
+# Pre-encoded /update payload, refreshed whenever a title or url changes
+update_entries: dict[str, tuple[str, str, str]] = {}  # {book: (title, date, url)}
+update_payload: bytes = b"{}"
+update_headers: dict[str, str] = {"ETag": ""}
+DEFAULT_UPDATE_DATE: str = datetime(2000, 1, 1).astimezone().isoformat()
+
+book_breakers: dict[str, CircuitBreaker] = {}
 
 book_index: int = 0
-loop_index: int = 0
 last_updated_time: float = time.time()
 
 
 app = FastAPI()
+coordinator = ShutdownCoordinator()
+app.add_middleware(DrainMiddleware, coordinator=coordinator)
+app.add_middleware(MetricsMiddleware)
+app.add_api_route("/metrics", metrics_endpoint)
+app.add_api_route("/debug/loop", loop_endpoint)
+update_cache_hits = cache_requests.labels("update", "hit")
+update_cache_misses = cache_requests.labels("update", "miss")
 NO_CACHE_HEADER: dict[str, str] = {
     "Content-Type": "application/json",
     "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
@@ -99,46 +133,32 @@ async def health_endpoint() -> JSONResponse:
 
 
 @app.get("/update")
-async def update_endpoint() -> JSONResponse:
-    payload: dict[str, tuple[str, str, str]] = {
-        book.name: (
-            titles[book.name][-1][0] if titles[book.name] else "Unknown",
-            titles[book.name][-1][1]
-            if titles[book.name]
-            else datetime(2000, 1, 1).astimezone().isoformat(),
-            book.url,
-        )
-        for book in books
-    }
-    return JSONResponse(content=payload, headers=NO_CACHE_HEADER)
-
-
-async def send_to_telebot(message: str) -> None:
-    url: str = f"https://api.telegram.org/bot{TELEBOT_TOKEN}/sendMessage"
-    payload: dict[str, str] = {"chat_id": TELEBOT_USER_ID, "text": message}
+async def update_endpoint(request: Request) -> Response:
+    if request.headers.get("if-none-match") == update_headers["ETag"]:
+        update_cache_hits.inc()
+        return Response(status_code=304, headers=update_headers)
 
-    try:
-        async with AsyncClient() as client:
-            await client.post(url, json=payload)
-
-    except Exception as e:
-        logger.error(f"Error occurred when sending message to telegram: {e!r}")
+    update_cache_misses.inc()
+    return Response(content=update_payload, headers=update_headers)
 
 
-async def send_to_bark(title: str, message: str) -> None:
-    try:
-        async with AsyncClient() as client:
-            await client.post(
-                BARK_URL,
-                json={
-                    "title": title,
-                    "body": message,
-                    "group": "Novel",
-                },
-            )
+def refresh_update_payload(*names: str) -> None:
+    for name in names:
+        update_entries[name] = (
+            titles[name][-1][0] if titles[name] else "Unknown",
+            titles[name][-1][1] if titles[name] else DEFAULT_UPDATE_DATE,
+            book_urls[name],
+        )
 
-    except Exception as e:
-        logger.error(f"Error occurred when sending message to bark server: {e!r}")
+    global update_payload, update_headers
+    update_payload = json.dumps(
+        update_entries, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    update_headers = {
+        "Content-Type": "application/json",
+        "Cache-Control": "no-cache",
+        "ETag": f'"{hashlib.md5(update_payload).hexdigest()}"',
+    }
 
 
 def load_books() -> None:
@@ -151,15 +171,24 @@ def load_books() -> None:
 
         with open(BOOK_PATH, "rb") as file:
             data = tomllib.load(file)
-            for novel in data["novels"]:
-                if not novel["monitored"]:
-                    continue
 
-                for site in novel["websites"]:
-                    if site["name"] != TARGETING_SITE:
-                        continue
+        load_sites(data.get("sites", []))
+
+        for novel in data["novels"]:
+            if not novel["monitored"]:
+                continue
+
+            mirrors: tuple[Mirror, ...] = tuple(
+                Mirror(site["name"], site["url"])
+                for site in novel["websites"]
+                if site["name"] in SITE_BACKENDS
+            )
+
+            if not mirrors:
+                logger.warning(f"No supported website found for {novel['name']}")
+                continue
 
-                    result.append(Book(novel["name"], site["url"]))
+            result.append(Book(novel["name"], mirrors))
 
     except Exception as e:
         logger.critical(f"Loading books failed with {e!r}")
@@ -168,19 +197,56 @@ def load_books() -> None:
     global books
     books = result
 
+    for book in books:
+        book_urls[book.name] = book.mirrors[0].url
+        # A broken book page is retried less often without affecting other books
+        book_breakers[book.name] = CircuitBreaker(
+            f"book {book.name}", base_delay=60 * 60 * 2, max_delay=60 * 60 * 24
+        )
+
     logger.info(f"Found {len(books)} books")
 
 
-def save_titles() -> None:
-    with open(BOOK_CACHE_PATH, "w") as file:
-        content: dict[str, list[list[str]]] = {
-            k: list(map(list, v)) for k, v in titles.items()
-        }
+async def save_titles() -> None:
+    # Titles are copied right after the rotation, with no await in between, so
+    # the snapshot holds every entry of the rotated journal
+    await journal.rotate()
+    content: dict[str, list[list[str]]] = {
+        k: list(map(list, v)) for k, v in titles.items()
+    }
+    await asyncio.to_thread(write_snapshot, content)
+
+
+def write_snapshot(content: dict[str, list[list[str]]]) -> None:
+    # Write a fresh snapshot atomically, after which the journal can be compacted
+    temp_path: str = f"{BOOK_CACHE_PATH}.tmp"
+
+    with open(temp_path, "w") as file:
         json.dump(content, file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, BOOK_CACHE_PATH)
+
+    # The rename only survives a power loss once the directory is synced too
+    directory: int = os.open(os.path.dirname(BOOK_CACHE_PATH), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+    journal.discard_rotated()
+
+
+def record_title(name: str, title: str, date: str) -> None:
+    titles[name].append((title, date))
+    journal.append(name, title, date)
+    refresh_update_payload(name)
 
 
 def load_titles() -> None:
     result: dict[str, deque[tuple[str, str]]] = {}
+    names: set[str] = {book.name for book in books}
 
     if not os.path.exists(BOOK_CACHE_PATH):
         logger.info("No cache found for titles")
@@ -193,7 +259,7 @@ def load_titles() -> None:
                 cache: dict[str, list[list[str]]] = json.load(file)
 
             for name, info_list in cache.items():
-                if name in [book.name for book in books]:
+                if name in names:
                     result[name] = deque(
                         [(info[0], info[1]) for info in info_list], maxlen=5
                     )
@@ -205,26 +271,38 @@ def load_titles() -> None:
         if book.name not in result:
             result[book.name] = deque(maxlen=5)
 
+    # Replay title changes recorded after the snapshot was written
+    replayed: int = 0
+    for name, title, date in journal.replay():
+        if name in names and not any(t == title for t, _ in result[name]):
+            result[name].append((title, date))
+            replayed += 1
+
+    logger.info(f"Replayed {replayed} title changes from journal")
+
     global titles
     titles = result
 
+    refresh_update_payload(*(book.name for book in books))
+
 
 async def get_html_via_scrape_do(url: str) -> str:
     async with AsyncClient(timeout=Timeout(60.0)) as client:
         response = await client.get(
-            "http://api.scrape.do/",
+            SCRAPER_URL,
             params={
                 "url": url,
                 "token": SCRAPER_KEY,
                 "geoCode": GEO_CODE,
             },
         )
+        response.raise_for_status()
         return response.text
 
 
-def extract_book_title(html: str) -> str:
+def extract_book_title(html: str, selector: str) -> str:
     tree = HTMLParser(html)
-    a_node = tree.css_first("div.latest-chapter a")
+    a_node = tree.css_first(selector)
 
     if a_node is not None:
         return a_node.text(strip=True)
@@ -233,30 +311,26 @@ def extract_book_title(html: str) -> str:
         raise Exception("Failed to extract book title from HTML")
 
 
-def successful_fetch() -> None:
-    global loop_index
-    global book_index
-    global last_updated_time
+class MirrorsUnavailable(Exception):
+    pass
 
-    loop_index = 0
-    book_index = (book_index + 1) % len(books)
-    last_updated_time = time.time()
 
-    logger.debug(f"Book fetched successfully for {books[book_index].name}")
+class PageUnparseable(Exception):
+    pass
+
 
+def next_book() -> Book | None:
+    global book_index
 
-async def failed_fetch(e: Exception) -> None:
-    global loop_index
+    # Skip books whose circuit is open so a broken page does not stall others
+    for _ in range(len(books)):
+        book = books[book_index]
+        book_index = (book_index + 1) % len(books)
 
-    loop_index += 1
-    logger.debug(f"Failed to fetch for {books[book_index].name}")
+        if book_breakers[book.name].allows_request():
+            return book
 
-    if loop_index == len(books):
-        save_titles()
-        await send_to_telebot(f"Novel monitor terminating from error {e!r}")
-        await send_to_bark("Novel monitor terminating", f"Error: {e!r}")
-        logger.critical(f"Program terminating from error {e!r}")
-        raise e
+    return None
 
 
 def get_first_number(string: str) -> int:
@@ -264,76 +338,151 @@ def get_first_number(string: str) -> int:
     return int(match.group(0)) if match else 0
 
 
-async def update_book() -> None:
-    try:
-        book_name = books[book_index].name
-        logger.debug(f"Try to fetch updates for {book_name}")
+async def fetch_book_title(book: Book) -> tuple[str, str]:
+    last_error: Exception | None = None
+    parse_error: Exception | None = None
 
-        url = books[book_index].url
-        html = await get_html_via_scrape_do(url)
-        title = extract_book_title(html)
+    mirrors: list[Mirror] = rank_mirrors(book.mirrors)
 
-        if title is None:
-            raise Exception("Should never happen with a valid proxy")
+    if not mirrors:
+        raise MirrorsUnavailable(f"No mirror available for {book.name}")
 
-        if not any(t == title for t, _ in titles[book_name]):
-            if titles[book_name]:
-                last_title = titles[book_name][-1][0]
+    # Try mirrors from the fastest healthy one until one of them succeeds
+    for mirror in mirrors:
+        backend = SITE_BACKENDS[mirror.site]
+        await backend.wait_for_rate_limit()
 
-                updated_count = get_first_number(title) - get_first_number(last_title)
+        start_time: float = time.perf_counter()
 
-                if not (1 <= updated_count <= 100):
-                    updated_count = -1
+        try:
+            html = await get_html_via_scrape_do(mirror.url)
 
-                await send_to_telebot(
-                    f"{book_name}\n本次更新{updated_count}章\n{last_title:.15}\n->{title:<.13}\n{url}",
-                )
-                await send_to_bark(
-                    book_name,
-                    f"本次更新{updated_count}章\n{last_title}\n->{title}\n{url}",
+        except Exception as e:
+            logger.warning(f"Failed to fetch {book.name} from {mirror.site}: {e!r}")
+            upstream_errors.labels(mirror.site).inc()
+            last_error = e
+
+            if backend.record_failure() and backend.breaker.trips == 1:
+                notifier.notify(
+                    "Novel monitor degraded",
+                    f"Site {mirror.site} is unavailable, failing over\n{e!r}",
+                    f"Site {mirror.site} is unavailable\nError: {e!r}",
                 )
+            continue
+
+        latency: float = time.perf_counter() - start_time
+        backend.record_success(latency)
+        upstream_seconds.labels(mirror.site).observe(latency)
+
+        # A page without the expected element is a problem of the book, not the site
+        try:
+            return extract_book_title(html, backend.selector), mirror.url
+        except Exception as e:
+            logger.warning(f"Failed to parse {book.name} from {mirror.site}: {e!r}")
+            parse_error = e
+
+    # Only a page no mirror can parse counts against the book, fetch failures
+    # are already counted against the sites
+    if parse_error is not None:
+        raise PageUnparseable(f"No mirror could parse {book.name}") from parse_error
+
+    raise MirrorsUnavailable(f"All mirrors failed for {book.name}") from last_error
+
 
-            titles[book_name].append((title, datetime.now().astimezone().isoformat()))
+async def update_book() -> None:
+    if (book := next_book()) is None:
+        logger.warning("All books are backing off, skipping this round")
+        return
+
+    book_name = book.name
+    logger.debug(f"Try to fetch updates for {book_name}")
 
-        successful_fetch()
+    try:
+        title, url = await fetch_book_title(book)
+
+    except MirrorsUnavailable as e:
+        logger.warning(f"Skipped {book_name}: {e}")
+        return
+
+    except PageUnparseable as e:
+        logger.error(f"Error {e!r} occurred when checking {book_name}")
+
+        breaker = book_breakers[book_name]
+        if breaker.record_failure() and breaker.trips == 1:
+            notifier.notify(
+                "Novel monitor degraded",
+                f"{book_name} keeps failing, backing off\n{e!r}",
+                f"{book_name} keeps failing\nError: {e!r}",
+            )
+        return
 
     except Exception as e:
         logger.error(f"Error {e!r} occurred when checking {book_name}")
-        logger.error(
-            f"Error occurred during iteration {loop_index} on line {e.__traceback__.tb_lineno if e.__traceback__ else '-1'}"
-        )
-        await failed_fetch(e)
+        return
+
+    book_breakers[book_name].record_success()
+
+    if book_urls[book_name] != url:
+        book_urls[book_name] = url
+        refresh_update_payload(book_name)
+
+    if not any(t == title for t, _ in titles[book_name]):
+        if titles[book_name]:
+            last_title = titles[book_name][-1][0]
+
+            updated_count = get_first_number(title) - get_first_number(last_title)
+
+            if not (1 <= updated_count <= 100):
+                updated_count = -1
+
+            notifier.notify(
+                book_name,
+                f"{book_name}\n本次更新{updated_count}章\n{last_title:.15}\n->{title:<.13}\n{url}",
+                f"本次更新{updated_count}章\n{last_title}\n->{title}\n{url}",
+            )
+
+        record_title(book_name, title, datetime.now().astimezone().isoformat())
+
+    global last_updated_time
+    last_updated_time = time.time()
+    logger.debug(f"Book fetched successfully for {book_name}")
 
 
 async def start_api_server() -> None:
     config = Config(app=app, host="0.0.0.0", port=80, log_level="critical")
-    await Server(config).serve()
+    await DrainingServer(config, coordinator).serve()
 
 
-def handle_termination_signal() -> None:
-    save_titles()
+async def save_titles_on_exit() -> None:
+    await save_titles()
     logger.info("Title saved before exiting")
-    raise SystemExit(0)
+
+
+async def flush_notifications_on_exit() -> None:
+    # Kept short so the container exits before Docker sends SIGKILL
+    await notifier.flush(timeout=NOTIFY_FLUSH_TIMEOUT)
 
 
 def job_listener(event: JobExecutionEvent) -> None:
+    # Failures are contained by the circuit breakers, so keep the monitor running
     if event.exception:
-        logger.error(f"Job raised an exception: {event.exception}")
-        asyncio.get_running_loop().stop()
-        handle_termination_signal()
+        logger.error(f"Job raised an exception: {event.exception!r}")
     else:
         logger.debug("Job executed successfully")
 
 
 def schedule_refreshes() -> None:
-    scheduler.add_job(
+    # A coroutine, so the journal rotation stays on the loop with the appends
+    add_job(
+        scheduler,
         save_titles,
         "cron",
         hour=10,
         minute=24,
     )
 
-    scheduler.add_job(
+    add_job(
+        scheduler,
         update_book,
         "cron",
         minute=12,
@@ -347,18 +496,14 @@ def schedule_refreshes() -> None:
 async def main() -> None:
     load_books()
     load_titles()
+    await save_titles()
 
-    match platform.system():
-        case "Linux":
-            asyncio.get_running_loop().add_signal_handler(
-                signal.SIGTERM, handle_termination_signal
-            )
-            logger.info("Signal handler for SIGTERM is registered.")
-
-        case _:
-            logger.info("Signal handler registration skipped.")
-            pass
+    # SIGTERM drains in-flight requests, then persists titles before notifying
+    coordinator.on_shutdown(save_titles_on_exit)
+    coordinator.on_shutdown(flush_notifications_on_exit)
 
+    notifier.start()
+    monitor.start()
     schedule_refreshes()
     logger.info("Novel monitor started")
 
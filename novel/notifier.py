@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Protocol
+
+from httpx import AsyncClient, HTTPStatusError, Response, Timeout
+
+logger = logging.getLogger("my_app")
+
+COALESCE_WINDOW: float = 5.0  # Seconds to wait for more updates before sending
+RETRY_ATTEMPTS: int = 5
+RETRY_BASE_DELAY: float = 2.0
+# Telegram allows about one message per second per chat
+TELEGRAM_MESSAGE_INTERVAL: float = 1.0
+TELEGRAM_MESSAGE_LIMIT: int = 4096
+
+client = AsyncClient(timeout=Timeout(30.0))
+
+
+@dataclass(frozen=True)
+class Notification:
+    title: str
+    telebot_message: str
+    bark_message: str
+
+
+# Kept in step with telebot/notifier.py
+def build_messages(texts: list[str]) -> list[str]:
+    # Pack as many texts as possible into each message
+    messages: list[str] = []
+    current: str = ""
+
+    for text in texts:
+        text = text[:TELEGRAM_MESSAGE_LIMIT]
+
+        if current and len(current) + len(text) + 2 > TELEGRAM_MESSAGE_LIMIT:
+            messages.append(current)
+            current = ""
+
+        current = f"{current}\n\n{text}" if current else text
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+class NotificationSink(Protocol):
+    name: str
+
+    async def send(
+        self, notifications: list[Notification], flushing: asyncio.Event
+    ) -> None: ...
+
+
+class RetryAfter(Exception):
+    def __init__(self, delay: float) -> None:
+        super().__init__(f"Retry after {delay} seconds")
+        self.delay = delay
+
+
+def raise_for_response(response: Response) -> None:
+    if response.status_code == 429:
+        try:
+            delay = float(response.json()["parameters"]["retry_after"])
+        except Exception:
+            delay = float(response.headers.get("retry-after", RETRY_BASE_DELAY))
+        raise RetryAfter(delay)
+
+    response.raise_for_status()
+
+
+class TelegramSink:
+    name = "telegram"
+
+    def __init__(
+        self, token: str, chat_id: str, api_url: str = "https://api.telegram.org"
+    ) -> None:
+        self.url: str = f"{api_url}/bot{token}/sendMessage"
+        self.chat_id: str = chat_id
+        self.next_message_time: float = 0.0
+
+    async def send(
+        self, notifications: list[Notification], flushing: asyncio.Event
+    ) -> None:
+        texts: list[str] = [
+            notification.telebot_message for notification in notifications
+        ]
+        for message in build_messages(texts):
+            if (delay := self.next_message_time - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+
+            await send_with_retry(self.name, flushing, self.post, message)
+            self.next_message_time = time.monotonic() + TELEGRAM_MESSAGE_INTERVAL
+
+    async def post(self, message: str) -> None:
+        response = await client.post(
+            self.url, json={"chat_id": self.chat_id, "text": message}
+        )
+        raise_for_response(response)
+
+
+class BarkSink:
+    name = "bark"
+
+    def __init__(self, url: str) -> None:
+        self.url: str = url
+
+    async def send(
+        self, notifications: list[Notification], flushing: asyncio.Event
+    ) -> None:
+        if len(notifications) == 1:
+            title = notifications[0].title
+            body = notifications[0].bark_message
+        else:
+            title = ", ".join(notification.title for notification in notifications)
+            body = "\n\n".join(
+                f"{notification.title}\n{notification.bark_message}"
+                for notification in notifications
+            )
+
+        await send_with_retry(self.name, flushing, self.post, title, body)
+
+    async def post(self, title: str, body: str) -> None:
+        response = await client.post(
+            self.url, json={"title": title, "body": body, "group": "Novel"}
+        )
+        raise_for_response(response)
+
+
+async def pause(delay: float, flushing: asyncio.Event) -> None:
+    # Cut short once a flush has started, so nothing waits past shutdown
+    try:
+        await asyncio.wait_for(flushing.wait(), delay)
+    except TimeoutError:
+        pass
+
+
+async def send_with_retry(name: str, flushing: asyncio.Event, post, *args) -> None:
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            await post(*args)
+            return
+
+        except RetryAfter as e:
+            delay = e.delay
+
+        except HTTPStatusError as e:
+            # Client errors other than rate limiting will not succeed on retry
+            if e.response.status_code < 500:
+                logger.error(f"Error occurred when sending message to {name}: {e!r}")
+                return
+            delay = RETRY_BASE_DELAY * 2**attempt
+
+        except Exception as e:
+            logger.warning(f"Error occurred when sending message to {name}: {e!r}")
+            delay = RETRY_BASE_DELAY * 2**attempt
+
+        await pause(delay, flushing)
+
+    logger.error(f"Giving up sending message to {name} after {RETRY_ATTEMPTS} attempts")
+
+
+class NotificationDispatcher:
+    def __init__(self, sinks: list[NotificationSink]) -> None:
+        self.sinks: list[NotificationSink] = sinks
+        self.queue: asyncio.Queue[Notification] = asyncio.Queue()
+        self.task: asyncio.Task | None = None
+        # Only set by flush on shutdown, which cuts waiting and backoff short
+        self.flushing: asyncio.Event | None = None
+
+    def start(self) -> None:
+        self.flushing = asyncio.Event()
+        self.task = asyncio.create_task(self.run(self.flushing))
+
+    def notify(self, title: str, telebot_message: str, bark_message: str) -> None:
+        self.queue.put_nowait(Notification(title, telebot_message, bark_message))
+
+    async def run(self, flushing: asyncio.Event) -> None:
+        while True:
+            batch: list[Notification] = [await self.queue.get()]
+
+            # Let updates detected around the same time join the same digest
+            await pause(COALESCE_WINDOW, flushing)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            notifications: list[Notification] = list(dict.fromkeys(batch))
+
+            await asyncio.gather(
+                *(self.send(sink, notifications, flushing) for sink in self.sinks)
+            )
+
+            for _ in batch:
+                self.queue.task_done()
+
+    async def send(
+        self,
+        sink: NotificationSink,
+        notifications: list[Notification],
+        flushing: asyncio.Event,
+    ) -> None:
+        try:
+            await sink.send(notifications, flushing)
+        except Exception as e:
+            logger.error(f"Error occurred when dispatching to {sink.name}: {e!r}")
+
+    async def flush(self, timeout: float = 30.0) -> None:
+        if self.task is None or self.flushing is None:
+            return
+
+        self.flushing.set()
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except TimeoutError:
+            logger.warning("Pending notifications dropped on flush timeout")
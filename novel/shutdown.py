@@ -0,0 +1,151 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+from collections.abc import Callable
+from types import FrameType
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+from uvicorn import Config, Server
+
+logger = logging.getLogger("my_app")
+
+# Docker sends SIGKILL 10 seconds after SIGTERM unless stop_grace_period is raised
+DRAIN_TIMEOUT: float = float(os.getenv("DRAIN_TIMEOUT", "6"))
+RETRY_AFTER: str = "5"
+SERVICE_RESTART: int = 1012  # WebSocket close code asking clients to reconnect
+
+
+class ShutdownCoordinator:
+    def __init__(self, drain_timeout: float = DRAIN_TIMEOUT) -> None:
+        self.drain_timeout: float = drain_timeout
+        self.stopping: bool = False
+        self.active: dict[str, int] = {"http": 0, "websocket": 0}
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.callbacks: list[Callable] = []
+
+    def on_shutdown(self, callback: Callable) -> Callable:
+        # Sync or async callbacks that persist state, run once after draining
+        self.callbacks.append(callback)
+        return callback
+
+    def enter(self, kind: str) -> None:
+        self.active[kind] += 1
+        self.idle.clear()
+
+    def leave(self, kind: str) -> None:
+        self.active[kind] -= 1
+        if not any(self.active.values()):
+            self.idle.set()
+
+    async def drain(self) -> None:
+        self.stopping = True
+        start_time: float = time.perf_counter()
+        logger.info(
+            f"Draining {self.active['http']} requests "
+            f"and {self.active['websocket']} WebSocket connections"
+        )
+
+        try:
+            await asyncio.wait_for(self.idle.wait(), self.drain_timeout)
+            logger.info(f"Drained in {time.perf_counter() - start_time:.2f} seconds")
+        except TimeoutError:
+            logger.warning(
+                f"Drain timed out with {self.active['http']} requests "
+                f"and {self.active['websocket']} WebSocket connections left"
+            )
+
+    async def flush(self) -> None:
+        for callback in self.callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred in shutdown callback {callback}")
+
+
+class DrainMiddleware:
+    # Counts in-flight requests and WebSocket connections, and turns new ones
+    # away once the coordinator is stopping
+    def __init__(self, app: ASGIApp, coordinator: ShutdownCoordinator) -> None:
+        self.app: ASGIApp = app
+        self.coordinator: ShutdownCoordinator = coordinator
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        kind: str = scope["type"]
+
+        if kind not in self.coordinator.active:
+            await self.app(scope, receive, send)
+            return
+
+        if self.coordinator.stopping:
+            await self.reject(kind, send)
+            return
+
+        self.coordinator.enter(kind)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.coordinator.leave(kind)
+
+    async def reject(self, kind: str, send: Send) -> None:
+        if kind == "websocket":
+            await send({"type": "websocket.close", "code": SERVICE_RESTART})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"connection", b"close"),
+                    (b"content-length", b"0"),
+                    (b"retry-after", RETRY_AFTER.encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+
+class DrainingServer(Server):
+    # SIGTERM stops the listener, waits for in-flight work, then lets uvicorn
+    # shut down. A second signal skips the rest of the drain.
+    def __init__(self, config: Config, coordinator: ShutdownCoordinator) -> None:
+        super().__init__(config)
+        self.coordinator: ShutdownCoordinator = coordinator
+        self.draining: bool = False
+        self.drain_task: asyncio.Task | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    async def serve(self, sockets=None) -> None:
+        self.loop = asyncio.get_running_loop()
+
+        try:
+            await super().serve(sockets)
+        finally:
+            await self.coordinator.flush()
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        if self.draining or self.loop is None:
+            # Like uvicorn, a repeated signal also skips waiting on connections
+            if self.draining:
+                self.force_exit = True
+            self.should_exit = True
+            return
+
+        self.draining = True
+        self.loop.call_soon_threadsafe(self.start_drain)
+
+    def start_drain(self) -> None:
+        self.drain_task = asyncio.create_task(self.drain())
+
+    async def drain(self) -> None:
+        # Established connections keep being served, new ones are refused
+        for server in getattr(self, "servers", []):
+            server.close()
+
+        await self.coordinator.drain()
+        self.should_exit = True
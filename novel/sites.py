@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from breaker import CircuitBreaker
+
+logger = logging.getLogger("my_app")
+
+# Weight of the newest observation in the moving averages
+LATENCY_SMOOTHING: float = 0.3
+SUCCESS_SMOOTHING: float = 0.2
+# Mirrors below this success rate are only tried after all healthy ones
+HEALTHY_SUCCESS_RATE: float = 0.5
+
+
+@dataclass(frozen=True)
+class Mirror:
+    site: str
+    url: str
+
+
+@dataclass
+class SiteBackend:
+    name: str
+    selector: str
+    rate_limit: float  # Minimum seconds between two requests to the site
+    latency: float = 0.0
+    success_rate: float = 1.0
+    next_request_time: float = 0.0
+    breaker: CircuitBreaker = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.breaker = CircuitBreaker(f"site {self.name}")
+
+    def is_healthy(self) -> bool:
+        return self.success_rate >= HEALTHY_SUCCESS_RATE
+
+    def is_ready(self) -> bool:
+        return time.monotonic() >= self.next_request_time
+
+    async def wait_for_rate_limit(self) -> None:
+        if (delay := self.next_request_time - time.monotonic()) > 0:
+            logger.debug(f"Waiting {delay:.1f} seconds for site {self.name}")
+            await asyncio.sleep(delay)
+
+        self.next_request_time = time.monotonic() + self.rate_limit
+
+    def record_success(self, latency: float) -> None:
+        if self.latency == 0:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+        self.success_rate += SUCCESS_SMOOTHING * (1 - self.success_rate)
+
+        self.breaker.record_success()
+
+    def record_failure(self) -> bool:
+        self.success_rate -= SUCCESS_SMOOTHING * self.success_rate
+        return self.breaker.record_failure()
+
+
+SITE_BACKENDS: dict[str, SiteBackend] = {}
+
+
+def register_site(name: str, selector: str, rate_limit: float = 10) -> SiteBackend:
+    backend = SiteBackend(name, selector, rate_limit)
+    SITE_BACKENDS[name] = backend
+    return backend
+
+
+def load_sites(sites: list[dict]) -> None:
+    # Sites defined in book.toml override the built-in ones with the same name
+    for site in sites:
+        register_site(
+            site["name"],
+            site["selector"],
+            float(site.get("rate_limit", 10)),
+        )
+
+    logger.info(f"Registered sites: {', '.join(SITE_BACKENDS)}")
+
+
+def rank_mirrors(mirrors: tuple[Mirror, ...]) -> list[Mirror]:
+    # Sites with an open circuit are left out entirely
+    available: list[Mirror] = [
+        mirror
+        for mirror in mirrors
+        if SITE_BACKENDS[mirror.site].breaker.allows_request()
+    ]
+
+    # Healthy and ready sites first, then the fastest among them
+    def sort_key(mirror: Mirror) -> tuple[bool, bool, float]:
+        backend = SITE_BACKENDS[mirror.site]
+        return (not backend.is_healthy(), not backend.is_ready(), backend.latency)
+
+    return sorted(available, key=sort_key)
+
+
+register_site("oop", "div.latest-chapter a")
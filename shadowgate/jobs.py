@@ -0,0 +1,149 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+
+from apscheduler.events import EVENT_JOB_MISSED, JobExecutionEvent
+from apscheduler.job import Job
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from metrics import registry
+
+logger = logging.getLogger("my_app")
+
+JOB_WORKERS: int = 4
+JOB_DEFAULTS: dict = {
+    "coalesce": True,  # Run a backlog of missed runs only once
+    "max_instances": 1,
+    "misfire_grace_time": 60,
+}
+
+thread_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+process_pool: ProcessPoolExecutor | None = None
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    misfires: int = 0
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+
+
+job_stats: dict[str, JobStats] = {}  # {job name: stats}
+job_names: dict[str, str] = {}  # {job id: job name}
+listened_schedulers: set[AsyncIOScheduler] = set()
+
+job_seconds = registry.histogram(
+    "scheduler_job_seconds",
+    "Scheduled job durations",
+    ("job",),
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+registry.callback(
+    "scheduler_job_failures_total",
+    "Scheduled job runs that raised",
+    lambda: {(name,): stats.failures for name, stats in job_stats.items()},
+    kind="counter",
+    labels=("job",),
+)
+registry.callback(
+    "scheduler_job_misfires_total",
+    "Scheduled job runs missed past their grace time",
+    lambda: {(name,): stats.misfires for name, stats in job_stats.items()},
+    kind="counter",
+    labels=("job",),
+)
+
+
+def get_process_pool() -> Executor:
+    global process_pool
+
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+
+    return process_pool
+
+
+def wrap_job(func: Callable, name: str, executor: Executor | None) -> Callable:
+    is_async: bool = inspect.iscoroutinefunction(func)
+    histogram = job_seconds.labels(name)
+
+    async def run(*args, **kwargs) -> None:
+        stats = job_stats[name]
+        start_time: float = time.perf_counter()
+
+        try:
+            if is_async:
+                await func(*args, **kwargs)
+            elif executor is None:
+                func(*args, **kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+        except Exception:
+            stats.failures += 1
+            raise
+
+        finally:
+            duration: float = time.perf_counter() - start_time
+            stats.runs += 1
+            stats.last_duration = duration
+            stats.max_duration = max(stats.max_duration, duration)
+            stats.total_duration += duration
+            histogram.observe(duration)
+            logger.debug(f"Job {name} finished in {duration:.3f} seconds")
+
+    return run
+
+
+def record_misfire(event: JobExecutionEvent) -> None:
+    name: str = job_names.get(event.job_id, event.job_id)
+    job_stats.setdefault(name, JobStats()).misfires += 1
+    logger.warning(f"Job {name} missed its run time {event.scheduled_run_time}")
+
+
+def add_job(
+    scheduler: AsyncIOScheduler,
+    func: Callable,
+    trigger: str,
+    name: str | None = None,
+    offload: bool = True,
+    use_process: bool = False,
+    **kwargs,
+) -> Job:
+    # Coroutines run on the loop. Sync callables go to a bounded pool, or stay
+    # on the loop with offload=False when they are short and touch loop state.
+    # use_process is for CPU-bound work whose arguments and function pickle.
+    if name is None:
+        name = func.func.__name__ if isinstance(func, partial) else func.__name__
+
+    if not offload:
+        executor: Executor | None = None
+    elif use_process:
+        executor = get_process_pool()
+    else:
+        executor = thread_pool
+
+    job_stats.setdefault(name, JobStats())
+
+    if scheduler not in listened_schedulers:
+        scheduler.add_listener(record_misfire, EVENT_JOB_MISSED)
+        listened_schedulers.add(scheduler)
+
+    job = scheduler.add_job(
+        wrap_job(func, name, executor),
+        trigger,
+        name=name,
+        **(JOB_DEFAULTS | kwargs),
+    )
+    job_names[job.id] = name
+
+    return job
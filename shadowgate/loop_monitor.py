@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from array import array
+from collections import deque
+from dataclasses import dataclass
+
+logger = logging.getLogger("my_app")
+
+TICK_INTERVAL: float = 0.1
+STALL_THRESHOLD: float = 0.2  # Lag above this captures the stack of the loop thread
+LAG_WINDOW: int = 3000  # Samples kept for percentiles, five minutes at one per tick
+STALL_HISTORY: int = 20
+QUANTILES: tuple[float, ...] = (0.5, 0.9, 0.99)
+
+
+@dataclass
+class Stall:
+    time: float
+    lag: float
+    stack: str
+
+
+class LoopMonitor:
+    # A tick task measures how late the loop wakes it up, while a watchdog
+    # thread grabs the loop's stack when a tick is overdue, i.e. while the
+    # blocking callback is still running
+    def __init__(
+        self,
+        interval: float = TICK_INTERVAL,
+        threshold: float = STALL_THRESHOLD,
+    ) -> None:
+        self.interval: float = interval
+        self.threshold: float = threshold
+        self.lags: array = array("d", bytes(8 * LAG_WINDOW))
+        self.index: int = 0
+        self.filled: int = 0
+        self.max_lag: float = 0.0
+        self.stalls: int = 0
+        self.recent: deque[Stall] = deque(maxlen=STALL_HISTORY)
+
+        self.last_tick: float = time.monotonic()
+        self.captured: bool = False
+        self.loop_thread_id: int | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.task is not None:
+            return
+
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.task = asyncio.create_task(self.tick())
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+        logger.info("Event loop monitor started")
+
+    async def tick(self) -> None:
+        while True:
+            expected: float = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now: float = time.monotonic()
+            self.record(max(0.0, now - expected))
+            self.last_tick = now
+
+    def record(self, lag: float) -> None:
+        self.lags[self.index] = lag
+        self.index = (self.index + 1) % LAG_WINDOW
+        self.filled = min(self.filled + 1, LAG_WINDOW)
+        self.max_lag = max(self.max_lag, lag)
+
+        if lag < self.threshold:
+            self.captured = False
+            return
+
+        self.stalls += 1
+        if self.captured and self.recent:
+            # The watchdog saw this stall, fill in how long it lasted in the end
+            self.recent[-1].lag = lag
+            logger.warning(f"Event loop was blocked for {lag:.3f} seconds")
+        else:
+            logger.warning(f"Event loop was blocked for {lag:.3f} seconds (no stack)")
+        self.captured = False
+
+    def watch(self) -> None:
+        while True:
+            time.sleep(self.threshold / 2)
+
+            overdue: float = time.monotonic() - self.last_tick - self.interval
+            if overdue < self.threshold or self.captured:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+
+            stack: str = "".join(traceback.format_stack(frame))
+            self.recent.append(Stall(time.time(), overdue, stack))
+            self.captured = True
+            logger.warning(
+                f"Event loop blocked for over {overdue:.3f} seconds in\n{stack}"
+            )
+
+    def quantiles(self) -> dict[tuple[str, ...], float]:
+        values: list[float] = sorted(self.lags[: self.filled])
+        if not values:
+            return {(str(q),): 0.0 for q in QUANTILES}
+
+        return {
+            (str(q),): values[min(len(values) - 1, int(q * len(values)))]
+            for q in QUANTILES
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "samples": self.filled,
+            "lag": {labels[0]: value for labels, value in self.quantiles().items()},
+            "max_lag": self.max_lag,
+            "stalls": self.stalls,
+            "recent_stalls": [
+                {"time": stall.time, "lag": stall.lag, "stack": stall.stack}
+                for stall in self.recent
+            ],
+        }
+
+
+monitor = LoopMonitor()
@@ -1,5 +1,4 @@
 import asyncio
-import logging
 import os
 from functools import partial
 
@@ -8,22 +7,20 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import Depends, FastAPI, HTTPException, Request, Response, WebSocket
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from httpx import AsyncClient
-from uvicorn import Config, Server
+from uvicorn import Config
 
+from jobs import add_job
+from logger import setup_logger
+from loop_monitor import monitor
+from metrics import MetricsMiddleware, loop_endpoint, metrics_endpoint, registry
 from mitce import update_mitce_config
+from profiler import profile_endpoint, register_profile_signal
+from proxy import ReverseProxy
+from shutdown import DrainingServer, DrainMiddleware, ShutdownCoordinator
 from subscription import get_config_file
 from sui import get_vless_inbounds, set_credentials
 
-logger = logging.getLogger("my_app")
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    fmt="%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.propagate = False
+logger = setup_logger("my_app")
 
 sui_token: str | None = os.getenv("SUI_TOKEN")
 mitce_url: str | None = os.getenv("MITCE_URL")
@@ -52,7 +49,29 @@ else:
 
 REQUEST_METHODS: list[str] = ["GET", "POST", "PUT", "DELETE", "PATCH"]
 app = FastAPI()
-client = AsyncClient()
+coordinator = ShutdownCoordinator()
+# Open tunnels are given DRAIN_TIMEOUT to finish when the container is stopped
+app.add_middleware(DrainMiddleware, coordinator=coordinator)
+app.add_middleware(MetricsMiddleware)
+# The dashboard expects the original host, as before the proxy was pooled
+dashboard_proxy = ReverseProxy(f"http://{PROXY_HOST}:{PROXY_PORT}", preserve_host=True)
+
+tunnels_active = registry.gauge("tunnels_active", "Open WebSocket tunnels", ("path",))
+# Text frames are counted in characters, encoding each one just to measure it
+# would cost the relay a copy per frame. VLESS traffic is all binary frames.
+tunnel_bytes = registry.counter(
+    "tunnel_bytes_total",
+    "Bytes relayed through tunnels, characters for text frames",
+    ("direction",),
+)
+tunnel_messages = registry.counter(
+    "tunnel_messages_total", "Messages relayed through tunnels", ("direction",)
+)
+# Resolved once, so the relay loops only pay for an attribute increment
+bytes_up = tunnel_bytes.labels("up")
+bytes_down = tunnel_bytes.labels("down")
+messages_up = tunnel_messages.labels("up")
+messages_down = tunnel_messages.labels("down")
 
 
 def check_for_host_domain(request: Request) -> None:
@@ -63,27 +82,8 @@ def check_for_host_domain(request: Request) -> None:
 async def forward_to_dashboard(
     request: Request, tail: str, proxy_path: str
 ) -> Response:
-    target_url: str = f"http://{PROXY_HOST}:{PROXY_PORT}{proxy_path}/{tail}"
-
-    forwarded_request = client.build_request(
-        method=request.method,
-        url=target_url,
-        headers=dict(request.headers),
-        content=await request.body(),
-        params=request.query_params,
-    )
-
-    forwarded_response = await client.send(forwarded_request)
-
-    response_content = await forwarded_response.aread()
-    response_headers = dict(forwarded_response.headers)
-    response_headers.pop("content-length", None)
-    response_headers.pop("content-encoding", None)
-
-    return Response(
-        content=response_content,
-        status_code=forwarded_response.status_code,
-        headers=response_headers,
+    return await dashboard_proxy.forward(
+        request, f"{proxy_path}/{tail}", route="dashboard"
     )
 
 
@@ -91,6 +91,8 @@ async def forward_to_proxy(incoming_ws: WebSocket, port: str, path: str) -> None
     target_url: str = f"ws://{PROXY_HOST}:{port}{path}"
 
     await incoming_ws.accept()
+    active = tunnels_active.labels(path)
+    active.inc()
 
     try:
         async with websockets.connect(target_url) as backend_ws:
@@ -101,11 +103,15 @@ async def forward_to_proxy(incoming_ws: WebSocket, port: str, path: str) -> None
 
                     if "text" in message:
                         await backend_ws.send(message["text"])
+                        bytes_up.inc(len(message["text"]))
                     elif "bytes" in message:
                         await backend_ws.send(message["bytes"])
+                        bytes_up.inc(len(message["bytes"]))
                     else:
                         break
 
+                    messages_up.inc()
+
             async def backend_to_client() -> None:
                 async for message in backend_ws:
                     if isinstance(message, bytes):
@@ -115,11 +121,18 @@ async def forward_to_proxy(incoming_ws: WebSocket, port: str, path: str) -> None
                     else:
                         await incoming_ws.send_text(bytes(message).decode("utf-8"))
 
+                    bytes_down.inc(len(message))
+
+                    messages_down.inc()
+
             await asyncio.gather(client_to_backend(), backend_to_client())
 
     except Exception:
         await incoming_ws.close(code=1001)
 
+    finally:
+        active.dec()
+
 
 async def get_config(request: Request, tail: str) -> Response:
     return await get_config_file(request, tail)
@@ -154,6 +167,27 @@ async def add_api_routes() -> None:
             methods=REQUEST_METHODS,
         )
 
+        # Metrics
+        app.add_api_route(
+            path="/metrics",
+            endpoint=metrics_endpoint,
+            dependencies=[Depends(check_for_host_domain)],
+        )
+
+        # Event loop lag and recent stalls, also needs the DEBUG_TOKEN header
+        app.add_api_route(
+            path="/debug/loop",
+            endpoint=loop_endpoint,
+            dependencies=[Depends(check_for_host_domain)],
+        )
+
+        # Sampling profiler, also needs the DEBUG_TOKEN header
+        app.add_api_route(
+            path="/debug/profile",
+            endpoint=profile_endpoint,
+            dependencies=[Depends(check_for_host_domain)],
+        )
+
         # Config refresh
         app.add_api_route(
             path="/conf/refresh",
@@ -187,7 +221,8 @@ async def refresh_config(request: Request) -> Response:
 def schedule_config_updates() -> None:
     scheduler = AsyncIOScheduler()
 
-    scheduler.add_job(
+    add_job(
+        scheduler,
         partial(update_mitce_config, MITCE_URL),
         "cron",
         hour="0,8,16",
@@ -199,7 +234,7 @@ def schedule_config_updates() -> None:
 
 async def start_api_server() -> None:
     config = Config(app=app, host="0.0.0.0", port=80, log_level="critical")
-    await Server(config).serve()
+    await DrainingServer(config, coordinator).serve()
 
 
 async def main() -> None:
@@ -210,6 +245,8 @@ async def main() -> None:
         PROXY_PATH,
     )
 
+    monitor.start()
+    register_profile_signal()
     await add_api_routes()
     schedule_config_updates()
 
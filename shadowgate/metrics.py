@@ -0,0 +1,326 @@
+import hmac
+import math
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from logger import dropped_records
+from loop_monitor import monitor
+
+# Upper bounds in seconds, values above the last one land in the +Inf bucket
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+# Unset disables /metrics and the debug endpoints, so nothing is exposed by default
+DEBUG_TOKEN: str | None = os.getenv("DEBUG_TOKEN")
+
+# Updates take no lock. Children are plain attribute increments so they can sit
+# on relay hot paths, and a rare lost increment from a worker thread is accepted.
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value: float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds: tuple[float, ...] = bounds
+        # One slot per bound plus the +Inf bucket, allocated once
+        self.counts: array = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start_time: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket containing the quantile
+        rank: float = q * self.count
+        seen: int = 0
+
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return math.inf
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+
+    escaped = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Family:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labelnames: tuple[str, ...],
+        factory: Callable,
+    ) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.kind: str = kind
+        self.labelnames: tuple[str, ...] = labelnames
+        self.factory: Callable = factory
+        self.children: dict[tuple[str, ...], Counter | Gauge | Histogram] = {}
+
+    def labels(self, *values: str):
+        # Hot paths should keep the returned child instead of looking it up
+        if (child := self.children.get(values)) is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[values] = self.factory()
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+        for values, child in list(self.children.items()):
+            if not isinstance(child, Histogram):
+                labels = format_labels(self.labelnames, values)
+                yield f"{self.name}{labels} {format_value(child.value)}"
+                continue
+
+            cumulative: int = 0
+            names = self.labelnames + ("le",)
+            for bound, count in zip(child.bounds + (math.inf,), child.counts):
+                cumulative += count
+                labels = format_labels(names, values + (format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackFamily:
+    # Values read at scrape time, for state that is already tracked elsewhere
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labelnames: tuple[str, ...],
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+    ) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.kind: str = kind
+        self.labelnames: tuple[str, ...] = labelnames
+        self.callback = callback
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+        result = self.callback()
+        values = result if isinstance(result, dict) else {(): result}
+        for labels, value in values.items():
+            yield (
+                f"{self.name}{format_labels(self.labelnames, labels)} "
+                f"{format_value(value)}"
+            )
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.families: dict[str, Family | CallbackFamily] = {}
+
+    def register(self, family: Family | CallbackFamily) -> None:
+        if family.name in self.families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self.families[family.name] = family
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Family:
+        family = Family(name, help, "counter", labels, Counter)
+        self.register(family)
+        return family
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Family:
+        family = Family(name, help, "gauge", labels, Gauge)
+        self.register(family)
+        return family
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Family:
+        family = Family(name, help, "histogram", labels, lambda: Histogram(buckets))
+        self.register(family)
+        return family
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        kind: str = "gauge",
+        labels: tuple[str, ...] = (),
+    ) -> CallbackFamily:
+        family = CallbackFamily(name, help, kind, labels, callback)
+        self.register(family)
+        return family
+
+    def render(self) -> bytes:
+        lines: list[str] = []
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return ("\n".join(lines) + "\n").encode()
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("route", "status")
+)
+http_seconds = registry.histogram(
+    "http_request_seconds", "HTTP request latency by route", ("route",)
+)
+upstream_seconds = registry.histogram(
+    "upstream_request_seconds", "Latency of calls to external APIs", ("upstream",)
+)
+upstream_errors = registry.counter(
+    "upstream_errors_total", "Failed calls to external APIs", ("upstream",)
+)
+cache_requests = registry.counter(
+    "cache_requests_total", "Cache lookups by result", ("cache", "result")
+)
+registry.callback(
+    "log_records_dropped_total",
+    "Log records dropped on a full logging queue",
+    dropped_records,
+    kind="counter",
+)
+registry.callback(
+    "event_loop_lag_seconds",
+    "Event loop scheduling lag over the recent window",
+    monitor.quantiles,
+    labels=("quantile",),
+)
+registry.callback(
+    "event_loop_stalls_total",
+    "Ticks delayed past the stall threshold",
+    lambda: monitor.stalls,
+    kind="counter",
+)
+
+
+class MetricsMiddleware:
+    # Routes are labelled by their template, so path parameters stay bounded
+    def __init__(self, app: ASGIApp) -> None:
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: int = 500
+        start_time: float = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path: str = getattr(route, "path", None) or "other"
+            http_seconds.labels(path).observe(time.perf_counter() - start_time)
+            http_requests.labels(path, str(status)).inc()
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if not has_debug_token(request):
+        return Response(status_code=404)
+
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+def has_debug_token(request: Request) -> bool:
+    # Prometheus sends it as a bearer credential, curl as x-debug-token
+    token: str = request.headers.get("x-debug-token") or request.headers.get(
+        "authorization", ""
+    ).removeprefix("Bearer ")
+    return DEBUG_TOKEN is not None and hmac.compare_digest(
+        token.encode(), DEBUG_TOKEN.encode()
+    )
+
+
+async def loop_endpoint(request: Request) -> Response:
+    # Stall stacks show the code paths of the service, so they need the token
+    if not has_debug_token(request):
+        return Response(status_code=404)
+
+    return JSONResponse(content=monitor.snapshot())
@@ -9,13 +9,16 @@ from constants import (
     MITCE_SHADOWROCKET_PATH,
     MITCE_SING_BOX_PATH,
 )
+from metrics import upstream_seconds
 
 logger = logging.getLogger("my_app")
+mitce_latency = upstream_seconds.labels("mitce")
 
 
 async def fetch_mitce_config(mitce_url: str, suffix: str) -> Response:
-    async with AsyncClient() as client:
-        return await client.get(f"{mitce_url}&app={suffix}")
+    with mitce_latency.time():
+        async with AsyncClient() as client:
+            return await client.get(f"{mitce_url}&app={suffix}")
 
 
 def write_config_file(file_path: str, content: str) -> None:
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import platform
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+
+from fastapi import Request, Response
+
+from metrics import has_debug_token
+
+logger = logging.getLogger("my_app")
+
+PROFILE_DIR: str = os.getenv("PROFILE_DIR", "/tmp")
+SAMPLE_INTERVAL: float = 0.01
+SIGNAL_PROFILE_SECONDS: int = 30
+MAX_PROFILE_SECONDS: int = 60
+
+# Only one profile runs at a time, and no thread exists while idle
+profile_lock = threading.Lock()
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    file_name: str = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({file_name}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float) -> Counter[str]:
+    # Collapsed stacks, one "thread;outer;...;inner" key per distinct stack
+    stacks: Counter[str] = Counter()
+    own_id: int = threading.get_ident()
+    deadline: float = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names: dict[int, str] = {t.ident: t.name for t in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+
+            frames: list[str] = []
+            current: FrameType | None = frame
+            while current is not None:
+                frames.append(frame_name(current))
+                current = current.f_back
+
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(frames))] += 1
+
+        time.sleep(SAMPLE_INTERVAL)
+
+    return stacks
+
+
+def collapse(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile(seconds: float) -> str | None:
+    if not profile_lock.acquire(blocking=False):
+        return None
+
+    try:
+        logger.info(f"Profiling for {seconds} seconds")
+        return collapse(sample_stacks(seconds))
+    finally:
+        profile_lock.release()
+
+
+async def profile_endpoint(request: Request, seconds: int = 10) -> Response:
+    if not has_debug_token(request):
+        return Response(status_code=404)
+
+    seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+    if (result := await asyncio.to_thread(profile, seconds)) is None:
+        return Response("A profile is already running\n", status_code=409)
+
+    return Response(result, media_type="text/plain")
+
+
+def profile_to_file(seconds: float) -> None:
+    if (result := profile(seconds)) is None:
+        logger.warning("A profile is already running, ignoring SIGUSR2")
+        return
+
+    path: str = os.path.join(PROFILE_DIR, f"profile-{int(time.time())}.txt")
+    with open(path, "w") as file:
+        file.write(result)
+
+    logger.info(f"Profile written to {path}")
+
+
+def register_profile_signal() -> None:
+    # kill -USR2 <pid> writes a profile to PROFILE_DIR without any HTTP access
+    match platform.system():
+        case "Linux":
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR2,
+                lambda: threading.Thread(
+                    target=profile_to_file,
+                    args=(SIGNAL_PROFILE_SECONDS,),
+                    name="profiler",
+                    daemon=True,
+                ).start(),
+            )
+
+        case _:
+            logger.info("Profile signal registration skipped.")
@@ -12,16 +12,15 @@ from constants import (
     MITCE_SHADOWROCKET_PATH,
     MITCE_SING_BOX_PATH,
 )
+from logger import setup_logger
 from sui import get_clients
 
-logger = logging.getLogger("config_access")
-logger.setLevel(logging.INFO)
 handler = TimedRotatingFileHandler(CONFIG_ACCESS_LOG_PATH, when="W0", backupCount=2)
 formatter = logging.Formatter("%(asctime)s - %(message)s", "%Y-%m-%d %H:%M:%S")
 handler.namer = lambda name: f"{name}.log"
 handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.propagate = False
+# Access records are written and rotated on the listener thread, not the loop
+logger = setup_logger("config_access", handler=handler)
 
 
 def get_static_config(file_name: str, client: dict[str, str]) -> FileResponse | None:
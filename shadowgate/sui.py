@@ -2,7 +2,10 @@ import logging
 
 import httpx
 
+from metrics import upstream_seconds
+
 logger = logging.getLogger("my_app")
+sui_latency = upstream_seconds.labels("sui")
 
 
 sui_session = httpx.AsyncClient()
@@ -24,35 +27,38 @@ def set_credentials(
 
 
 async def get_load_json() -> dict:
-    response = (
-        await httpx.AsyncClient().get(
-            f"{SUI_URL}/apiv2/load", headers={"token": SUI_TOKEN}
-        )
-    ).json()
+    with sui_latency.time():
+        response = (
+            await httpx.AsyncClient().get(
+                f"{SUI_URL}/apiv2/load", headers={"token": SUI_TOKEN}
+            )
+        ).json()
 
     assert response["success"]
     return response
 
 
 async def get_inbounds_json(ids: list[int]) -> dict:
-    response = (
-        await httpx.AsyncClient().get(
-            f"{SUI_URL}/apiv2/inbounds?id={','.join(map(str, ids))}",
-            headers={"token": SUI_TOKEN},
-        )
-    ).json()
+    with sui_latency.time():
+        response = (
+            await httpx.AsyncClient().get(
+                f"{SUI_URL}/apiv2/inbounds?id={','.join(map(str, ids))}",
+                headers={"token": SUI_TOKEN},
+            )
+        ).json()
 
     assert response["success"]
     return response
 
 
 async def get_clients_json(ids: list[int]) -> dict:
-    response = (
-        await httpx.AsyncClient().get(
-            f"{SUI_URL}/apiv2/clients?id={','.join(map(str, ids))}",
-            headers={"token": SUI_TOKEN},
-        )
-    ).json()
+    with sui_latency.time():
+        response = (
+            await httpx.AsyncClient().get(
+                f"{SUI_URL}/apiv2/clients?id={','.join(map(str, ids))}",
+                headers={"token": SUI_TOKEN},
+            )
+        ).json()
 
     assert response["success"]
     return response
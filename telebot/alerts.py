@@ -0,0 +1,136 @@
+import logging
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from stats import Sample
+
+logger = logging.getLogger("my_app")
+
+# A breached rule only resolves once the value is this far back inside its limit
+HYSTERESIS: float = 0.1
+MB: int = 1024 * 1024
+
+# [container:]metric[>|<threshold][@seconds], e.g. "cpu>90@300" or "novel:exited"
+RULE_PATTERN = re.compile(
+    r"^(?:(?P<container>[\w.-]+):)?(?P<metric>cpu|memory|exited)"
+    r"(?:(?P<operator>[<>])(?P<threshold>\d+(?:\.\d+)?))?(?:@(?P<duration>\d+))?$"
+)
+DEFAULT_RULES: str = "cpu>90@300;exited"
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    text: str
+    container: str | None
+    metric: str  # cpu in percent, memory in MB, or exited
+    above: bool
+    threshold: float
+    duration: float
+
+    def value(self, sample: Sample) -> float:
+        return sample.cpu if self.metric == "cpu" else sample.memory / MB
+
+    def breached(self, value: float) -> bool:
+        return value > self.threshold if self.above else value < self.threshold
+
+    def recovered(self, value: float) -> bool:
+        margin: float = abs(self.threshold) * HYSTERESIS
+        if self.above:
+            return value < self.threshold - margin
+        return value > self.threshold + margin
+
+
+@dataclass
+class AlertState:
+    breach_since: float | None = None
+    firing: bool = False
+
+
+def parse_rules(text: str) -> list[AlertRule]:
+    rules: list[AlertRule] = []
+
+    for part in filter(None, (part.strip() for part in text.split(";"))):
+        if (match := RULE_PATTERN.match(part)) is None or (
+            match["metric"] != "exited" and match["threshold"] is None
+        ):
+            logger.error(f"Skipping invalid alert rule {part}")
+            continue
+
+        rules.append(
+            AlertRule(
+                text=part.removeprefix(f"{match['container']}:"),
+                container=match["container"],
+                metric=match["metric"],
+                above=match["operator"] != "<",
+                threshold=float(match["threshold"] or 0),
+                duration=float(match["duration"] or 0),
+            )
+        )
+
+    logger.info(f"Loaded {len(rules)} alert rules")
+    return rules
+
+
+class AlertEngine:
+    def __init__(self, rules: list[AlertRule], notify: Callable[[str], None]) -> None:
+        self.notify: Callable[[str], None] = notify
+        # Rules indexed by container so each sample only visits the rules it can match
+        self.global_rules: list[AlertRule] = []
+        self.container_rules: dict[str, list[AlertRule]] = {}
+        self.states: dict[tuple[AlertRule, str], AlertState] = {}
+
+        for rule in rules:
+            if rule.container is None:
+                self.global_rules.append(rule)
+            else:
+                self.container_rules.setdefault(rule.container, []).append(rule)
+
+    def rules_for(self, name: str) -> list[AlertRule]:
+        return self.global_rules + self.container_rules.get(name, [])
+
+    def state(self, rule: AlertRule, name: str) -> AlertState:
+        if (key := (rule, name)) not in self.states:
+            self.states[key] = AlertState()
+        return self.states[key]
+
+    def observe(self, name: str, sample: Sample | None) -> None:
+        # A missing sample means the container is no longer running
+        for rule in self.rules_for(name):
+            if rule.metric == "exited":
+                self.evaluate_exit(rule, name, running=sample is not None)
+            elif sample is not None:
+                self.evaluate(rule, name, sample)
+
+    def evaluate(self, rule: AlertRule, name: str, sample: Sample) -> None:
+        state = self.state(rule, name)
+        value: float = rule.value(sample)
+
+        if state.firing:
+            if rule.recovered(value):
+                state.firing = False
+                state.breach_since = None
+                self.notify(f"Resolved: {name} {rule.text} (now {value:.1f})")
+            return
+
+        if not rule.breached(value):
+            state.breach_since = None
+            return
+
+        if state.breach_since is None:
+            state.breach_since = sample.time
+
+        if sample.time - state.breach_since >= rule.duration:
+            state.firing = True
+            self.notify(f"Alert: {name} {rule.text} (now {value:.1f})")
+
+    def evaluate_exit(self, rule: AlertRule, name: str, running: bool) -> None:
+        state = self.state(rule, name)
+
+        if not running and not state.firing:
+            state.firing = True
+            self.notify(f"Alert: {name} exited")
+
+        elif running and state.firing:
+            state.firing = False
+            self.notify(f"Resolved: {name} is running again")
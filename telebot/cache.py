@@ -0,0 +1,46 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from functools import wraps
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def ttl_cache(
+    seconds: float,
+) -> Callable[[Callable[[], Awaitable[T]]], Callable[[], Awaitable[T]]]:
+    # Results are reused for a short while, and concurrent callers share one fetch
+    def decorator(fetch: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+        result: list[T] = []
+        expiry_time: float = 0.0
+        pending: asyncio.Task[T] | None = None
+
+        async def refresh() -> T:
+            nonlocal expiry_time, pending
+
+            try:
+                value = await fetch()
+                result[:] = [value]
+                expiry_time = time.monotonic() + seconds
+                return value
+
+            finally:
+                pending = None
+
+        @wraps(fetch)
+        async def wrapper() -> T:
+            nonlocal pending
+
+            if result and time.monotonic() < expiry_time:
+                return result[0]
+
+            if pending is None:
+                pending = asyncio.create_task(refresh())
+
+            # Shielded so a cancelled caller does not abort the shared fetch
+            return await asyncio.shield(pending)
+
+        return wrapper
+
+    return decorator
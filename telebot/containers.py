@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, TypeVar
+
+# The Docker SDK is slow to import, so it is only loaded on first use
+if TYPE_CHECKING:
+    import docker
+    from docker.models.containers import Container
+
+logger = logging.getLogger("my_app")
+
+T = TypeVar("T")
+
+DOCKER_SOCKET: str = "unix:///var/run/docker.sock"
+DOCKER_WORKERS: int = 8
+START_CONCURRENCY: int = 4
+
+RESTART_BASE_DELAY: float = 5.0
+RESTART_MAX_DELAY: float = 60.0 * 5
+CRASH_LOOP_LIMIT: int = 5  # Restarts allowed within the window below
+CRASH_LOOP_WINDOW: float = 60.0 * 10
+MANUAL_STOP_WINDOW: float = 30.0  # A die this soon after a kill was requested
+EVENTS_RECONNECT_DELAY: float = 10.0
+
+# Docker SDK calls are blocking, so they all run on this dedicated pool
+executor = ThreadPoolExecutor(max_workers=DOCKER_WORKERS, thread_name_prefix="docker")
+docker_client: "docker.DockerClient | None" = None
+docker_client_lock = threading.Lock()
+
+
+def get_docker_client() -> "docker.DockerClient":
+    global docker_client
+
+    with docker_client_lock:
+        if docker_client is None:
+            start_time: float = time.perf_counter()
+            import docker
+
+            docker_client = docker.DockerClient(DOCKER_SOCKET)
+            logger.info(
+                f"Docker client ready in {time.perf_counter() - start_time:.2f} seconds"
+            )
+
+    return docker_client
+
+
+async def run_docker(func: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def should_restore(container: "Container") -> bool:
+    # Containers stopped manually are left alone
+    return container.attrs["HostConfig"]["RestartPolicy"]["Name"] != "unless-stopped"
+
+
+def list_exited_containers() -> list["Container"]:
+    exited_containers: list["Container"] = get_docker_client().containers.list(
+        all=True, filters={"status": "exited"}
+    )
+
+    return [container for container in exited_containers if should_restore(container)]
+
+
+async def restore(
+    progress: Callable[[list[str]], Awaitable[None]] | None = None,
+) -> list[str]:
+    exited_containers: list["Container"] = await run_docker(list_exited_containers)
+
+    if not exited_containers:
+        return ["No exited containers to restart"]
+
+    reply: list[str] = [
+        f"Restarting container: {container.name}" for container in exited_containers
+    ]
+    semaphore = asyncio.Semaphore(START_CONCURRENCY)
+
+    async def start(index: int, container: "Container") -> None:
+        async with semaphore:
+            try:
+                await run_docker(container.start)
+                reply[index] = f"Restarted container: {container.name}"
+
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred when starting {container.name}")
+                reply[index] = f"Failed to restart container: {container.name}"
+
+        if progress is not None:
+            await progress(reply)
+
+    await asyncio.gather(
+        *(start(index, container) for index, container in enumerate(exited_containers))
+    )
+
+    return reply
+
+
+class ContainerWatcher:
+    def __init__(self, notify: Callable[[str], None]) -> None:
+        self.notify: Callable[[str], None] = notify
+        self.queue: asyncio.Queue[dict] = asyncio.Queue()
+        self.killed: dict[str, float] = {}  # {container id: time of the kill event}
+        self.restarts: dict[str, deque[float]] = {}  # {container name: restart times}
+        self.pending: set[str] = set()
+        # The loop only keeps weak references, so restarts waiting out their
+        # backoff are held here until they finish
+        self.restart_tasks: set[asyncio.Task] = set()
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        # The events stream blocks forever, so it gets its own thread
+        threading.Thread(
+            target=self.stream_events,
+            args=(asyncio.get_running_loop(),),
+            name="docker-events",
+            daemon=True,
+        ).start()
+
+        self.task = asyncio.create_task(self.run())
+
+    def stream_events(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            try:
+                for event in get_docker_client().events(
+                    decode=True,
+                    filters={"type": "container", "event": ["die", "kill"]},
+                ):
+                    loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred in the Docker events stream")
+
+            time.sleep(EVENTS_RECONNECT_DELAY)
+
+    async def run(self) -> None:
+        while True:
+            event: dict = await self.queue.get()
+
+            container_id: str = event["Actor"]["ID"]
+            attributes: dict[str, str] = event["Actor"].get("Attributes", {})
+            name: str = attributes.get("name", container_id[:12])
+
+            if event["Action"] == "kill":
+                self.killed[container_id] = time.monotonic()
+                continue
+
+            killed_time: float = self.killed.pop(container_id, -math.inf)
+            if time.monotonic() - killed_time < MANUAL_STOP_WINDOW:
+                logger.info(f"Container {name} was stopped on request")
+                continue
+
+            # One-shot jobs and clean stops from inside exit with 0, an OOM kill
+            # always shows up as 137
+            exit_code: str = attributes.get("exitCode", "-")
+            if exit_code == "0":
+                logger.info(f"Container {name} exited cleanly, leaving it stopped")
+                continue
+
+            if container_id not in self.pending:
+                self.pending.add(container_id)
+                task = asyncio.create_task(self.restart(container_id, name, exit_code))
+                self.restart_tasks.add(task)
+                task.add_done_callback(self.restart_tasks.discard)
+
+    async def restart(self, container_id: str, name: str, exit_code: str) -> None:
+        try:
+            container: "Container" = await run_docker(
+                lambda: get_docker_client().containers.get(container_id)
+            )
+            if not should_restore(container):
+                return
+
+            restarts = self.restarts.setdefault(name, deque())
+            while restarts and time.monotonic() - restarts[0] > CRASH_LOOP_WINDOW:
+                restarts.popleft()
+
+            if len(restarts) >= CRASH_LOOP_LIMIT:
+                self.notify(f"Container {name} is crash looping, leaving it stopped")
+                return
+
+            delay: float = min(
+                RESTART_BASE_DELAY * 2 ** len(restarts), RESTART_MAX_DELAY
+            )
+            await asyncio.sleep(delay)
+
+            # Someone or the restart policy may have started it in the meantime
+            await run_docker(container.reload)
+            if container.status != "exited":
+                return
+
+            await run_docker(container.start)
+            restarts.append(time.monotonic())
+            self.notify(f"Restarted container {name} (exit code {exit_code})")
+
+        except Exception as e:
+            logger.error(f"Error {e!r} occurred when restarting {name}")
+            self.notify(f"Failed to restart container {name}: {e!r}")
+
+        finally:
+            self.pending.discard(container_id)
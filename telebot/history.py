@@ -0,0 +1,116 @@
+import math
+import time
+from array import array
+from dataclasses import dataclass
+
+HISTORY_RESOLUTION: int = 60  # Seconds covered by each slot
+HISTORY_SLOTS: int = 7 * 24 * 60  # One week of one-minute slots
+
+SPARK_CHARACTERS: str = "▁▂▃▄▅▆▇█"
+
+
+@dataclass(frozen=True)
+class Bucket:
+    time: float  # Start of the bucket as a unix timestamp
+    cpu: float
+    cpu_peak: float
+    memory: float
+
+
+# Fixed-size ring buffers of per-minute aggregates, empty slots hold NaN
+class UsageHistory:
+    def __init__(self) -> None:
+        self.cpu: array = array("f", [math.nan]) * HISTORY_SLOTS
+        self.cpu_peak: array = array("f", [math.nan]) * HISTORY_SLOTS
+        self.memory: array = array("f", [math.nan]) * HISTORY_SLOTS
+        self.counts: array = array("H", [0]) * HISTORY_SLOTS
+        self.last_slot: int = -1  # Absolute slot number written last
+
+    def add(self, now: float, cpu: float, memory: int) -> None:
+        slot: int = int(now // HISTORY_RESOLUTION)
+
+        if slot < self.last_slot:
+            return
+
+        # Clear slots skipped since the last sample, at most one full lap
+        for skipped in range(max(self.last_slot + 1, slot - HISTORY_SLOTS + 1), slot):
+            self.clear(skipped % HISTORY_SLOTS)
+
+        index: int = slot % HISTORY_SLOTS
+        if slot != self.last_slot:
+            self.clear(index)
+            self.last_slot = slot
+
+        count: int = min(self.counts[index] + 1, 0xFFFF)
+        self.counts[index] = count
+
+        if count == 1:
+            self.cpu[index] = cpu
+            self.cpu_peak[index] = cpu
+            self.memory[index] = memory
+        else:
+            self.cpu[index] += (cpu - self.cpu[index]) / count
+            self.cpu_peak[index] = max(self.cpu_peak[index], cpu)
+            self.memory[index] += (memory - self.memory[index]) / count
+
+    def clear(self, index: int) -> None:
+        self.cpu[index] = math.nan
+        self.cpu_peak[index] = math.nan
+        self.memory[index] = math.nan
+        self.counts[index] = 0
+
+    def window(self, array_: array, start: int, end: int) -> list[float]:
+        # Values of absolute slots [start, end) in chronological order
+        first, last = start % HISTORY_SLOTS, end % HISTORY_SLOTS
+
+        if end - start >= HISTORY_SLOTS:
+            return list(array_[first:] + array_[:first])
+        if first < last:
+            return list(array_[first:last])
+        return list(array_[first:] + array_[:last])
+
+    def downsample(self, duration: float, points: int) -> list[Bucket]:
+        end: int = int(time.time() // HISTORY_RESOLUTION) + 1
+        slots: int = min(max(int(duration // HISTORY_RESOLUTION), 1), HISTORY_SLOTS)
+        start: int = end - slots
+        size: int = max(math.ceil(slots / points), 1)
+
+        # Slots never written or already overwritten are treated as empty
+        oldest: int = max(self.last_slot - HISTORY_SLOTS + 1, 0)
+        cpu = self.window(self.cpu, start, end)
+        cpu_peak = self.window(self.cpu_peak, start, end)
+        memory = self.window(self.memory, start, end)
+
+        buckets: list[Bucket] = []
+        for offset in range(0, slots, size):
+            bucket_start: int = start + offset
+            valid: list[int] = [
+                i
+                for i in range(offset, min(offset + size, slots))
+                if oldest <= start + i <= self.last_slot and not math.isnan(cpu[i])
+            ]
+
+            buckets.append(
+                Bucket(
+                    bucket_start * HISTORY_RESOLUTION,
+                    sum(cpu[i] for i in valid) / len(valid) if valid else math.nan,
+                    max((cpu_peak[i] for i in valid), default=math.nan),
+                    sum(memory[i] for i in valid) / len(valid) if valid else math.nan,
+                )
+            )
+
+        return buckets
+
+
+def sparkline(values: list[float]) -> str:
+    present: list[float] = [value for value in values if not math.isnan(value)]
+    if not present:
+        return " " * len(values)
+
+    low, high = min(present), max(present)
+    scale: float = (len(SPARK_CHARACTERS) - 1) / (high - low) if high > low else 0
+
+    return "".join(
+        " " if math.isnan(value) else SPARK_CHARACTERS[round((value - low) * scale)]
+        for value in values
+    )
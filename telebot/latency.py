@@ -0,0 +1,38 @@
+import math
+from bisect import bisect_left
+
+# Upper bounds in seconds, the last bucket catches everything slower
+LATENCY_BUCKETS: tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts: list[int] = [0] * len(LATENCY_BUCKETS)
+        self.total: float = 0.0
+        self.count: int = 0
+        self.timeouts: int = 0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket containing the quantile
+        rank: float = q * self.count
+        seen: int = 0
+
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return math.inf
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+def format_bound(seconds: float) -> str:
+    return ">60s" if math.isinf(seconds) else f"{seconds:g}s"
@@ -1,45 +1,79 @@
 import asyncio
-import json
-import logging
+import math
 import os
+import platform
 import re
+import secrets
+import signal
+import time
+from collections.abc import Awaitable, Callable
 from datetime import datetime
+from urllib.parse import urlparse
 
-import docker
 import httpx
-from docker.models.containers import Container
-from telegram import BotCommand, LinkPreviewOptions, Update
+from telegram import BotCommand, LinkPreviewOptions, Message, Update
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, ContextTypes
 
-logger = logging.getLogger("my_app")
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    fmt="%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.propagate = False
+from alerts import DEFAULT_RULES, AlertEngine, parse_rules
+from cache import ttl_cache
+from containers import ContainerWatcher, restore
+from history import sparkline
+from latency import LatencyHistogram, format_bound
+from logger import setup_logger
+from loop_monitor import monitor
+from notifier import ChatNotifier
+from stats import ContainerStats, StatsSampler
+from webhook import WebhookServer
+
+logger = setup_logger("my_app")
 
 novel_url: str | None = os.getenv("NOVEL_URL")
-glances_rul: str | None = os.getenv("GLANCES_URL")
 telebot_token: str | None = os.getenv("TELEBOT_TOKEN")
 telebot_user_id: str | None = os.getenv("TELEBOT_USER_ID")
 
-if (
-    novel_url is None
-    or glances_rul is None
-    or telebot_token is None
-    or telebot_user_id is None
-):
+if novel_url is None or telebot_token is None or telebot_user_id is None:
     logger.critical("Environment variables not fulfilled")
     raise SystemExit(1)
 else:
     NOVEL_URL: str = novel_url
-    GLANCES_URL: str = glances_rul
     TELEBOT_TOKEN: str = telebot_token
     TELEBOT_USER_ID: str = telebot_user_id
 
+# Optional, the dashboard leaves out the apiserver section when unset
+APISERVER_URL: str | None = os.getenv("APISERVER_URL")
+ALERT_RULES: str = os.getenv("ALERT_RULES", DEFAULT_RULES)
+# Public https url Telegram posts updates to, polling is used when unset
+WEBHOOK_URL: str | None = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Point the bot at another Bot API server, such as a local fake one for testing
+TELEGRAM_API_URL: str | None = os.getenv("TELEGRAM_API_URL")
+
+MB: int = 1024 * 1024
+HISTORY_POINTS: int = 32  # Sparkline width that fits a phone screen
+MESSAGE_LIMIT: int = 4096
+
+COMMAND_WORKERS: int = 8  # Updates processed at the same time
+COMMAND_TIMEOUT: float = 30.0
+RESTORE_TIMEOUT: float = 60.0 * 5
+
+# Characters separating the short title of a novel from the rest of its name
+NAME_PATTERN = re.compile(r"[^\-－—–,:()\[\]，：（）【】]+")
+
+novel_etag: str | None = None
+novel_reply: list[str] = []
+rendered_books: dict[str, tuple[tuple[str, ...], str]] = {}  # {name: (entry, text)}
+command_latencies: dict[str, LatencyHistogram] = {}
+background_tasks: set[asyncio.Task] = set()
+
+# CPU time spent before this point is almost entirely module imports
+STARTUP_TIME: float = time.perf_counter()
+logger.info(f"Modules imported using {time.process_time():.2f} seconds of CPU time")
+
+http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+sampler = StatsSampler()
+
 
 def markdown_v2_encode(reply) -> str:
     text: str = "\n".join(reply)
@@ -51,100 +85,224 @@ def default_encode(reply) -> str:
     return text
 
 
+def chunk_encode(reply: list[str]) -> list[str]:
+    # Split between lines so each message stays within Telegram's length limit
+    chunks: list[str] = []
+    current: list[str] = []
+    length: int = 0
+
+    for line in reply:
+        line = line[:MESSAGE_LIMIT]
+
+        if current and length + len(line) + 1 > MESSAGE_LIMIT:
+            chunks.append(default_encode(current))
+            current, length = [], 0
+
+        current.append(line)
+        length += len(line) + 1
+
+    if current:
+        chunks.append(default_encode(current))
+
+    return chunks
+
+
 async def container_usage() -> list[str]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(GLANCES_URL)
+    containers: list[ContainerStats] = sampler.snapshot()
 
-    if response.status_code != 200:
+    if not containers:
         return ["Container usage is not currently available"]
 
-    failed_count: int = 0
     total_cpu_usage: float = 0
     total_memory_usage: int = 0
-    containers: list[dict] = response.json()
 
     reply: list[str] = []
-    reply.append(f"{'Name':<12} {'CPU':<5}  {'Memory':<5}")
+    reply.append(
+        f"{'Name':<12} {'CPU':>6} {'Avg':>6} {'Peak':>6}  {'Memory':>8} {'Peak':>8}"
+    )
 
     for container in containers:
-        try:
-            container_name: str = container["name"]
+        assert container.current is not None
+        cpu_percentage: float = container.current.cpu
+        memory_usage: int = container.current.memory
+
+        total_cpu_usage += cpu_percentage
+        total_memory_usage += memory_usage
+
+        reply.append(
+            f"{container.name:<12.12} {cpu_percentage:>5.1f}% "
+            f"{container.cpu_average:>5.1f}% {container.cpu_peak:>5.1f}%  "
+            f"{memory_usage / MB:>5.1f} MB "
+            f"{container.memory_peak / MB:>5.1f} MB"
+        )
 
-            cpu_percentage: float = container["cpu"]["total"]
+    total_memory_usage_mb: float = total_memory_usage / MB
 
-            memory_usage: int = container["memory"]["usage"]
-            memory_usage_mb: float = memory_usage / (1024 * 1024)
+    reply.append("")
+    reply.append(f"Docker CPU Usage: {total_cpu_usage:.2f} %")
+    reply.append(f"Docker Memory Usage: {total_memory_usage_mb:.2f} MB")
 
-            total_cpu_usage += cpu_percentage
-            total_memory_usage += memory_usage
+    return reply
 
-            reply.append(
-                f"{container_name:<12} {cpu_percentage:<5.2f}% {memory_usage_mb:<5.1f} MB"
-            )
-        except Exception as e:
-            failed_count += 1
-            logger.error(
-                f"Error {e!r} occurred when processing container data {container}"
-            )
-            continue
 
-    total_memory_usage_mb: float = total_memory_usage / (1024 * 1024)
+def usage_history(name: str, hours: float) -> list[str]:
+    if (found := sampler.find_history(name)) is None:
+        return [f"No usage history for {name}"]
 
-    reply.append("")
-    reply.append(f"Docker CPU Usage: {total_cpu_usage:.2f} %")
-    reply.append(f"Docker Memory Usage: {total_memory_usage_mb:.2f} MB")
+    name, history = found
+    buckets = history.downsample(hours * 60 * 60, HISTORY_POINTS)
 
-    if failed_count > 0:
-        reply.append(f"Failed to retrieve data for {failed_count} containers")
+    cpu: list[float] = [bucket.cpu for bucket in buckets]
+    memory: list[float] = [bucket.memory / MB for bucket in buckets]
+
+    if all(math.isnan(value) for value in cpu):
+        return [f"No usage history for {name} in the last {hours:g} hours"]
+
+    peak = max(
+        (bucket for bucket in buckets if not math.isnan(bucket.cpu_peak)),
+        key=lambda bucket: bucket.cpu_peak,
+    )
+    peak_time: str = datetime.fromtimestamp(peak.time).strftime("%b-%d %H:%M")
+
+    def average(values: list[float]) -> float:
+        present = [value for value in values if not math.isnan(value)]
+        return sum(present) / len(present)
+
+    return [
+        f"{name}, last {hours:g} hours",
+        f"CPU {sparkline(cpu)}",
+        f"Mem {sparkline(memory)}",
+        "",
+        f"CPU avg {average(cpu):.1f}%, peak {peak.cpu_peak:.1f}% at {peak_time}",
+        f"Memory avg {average(memory):.1f} MB, "
+        f"max {max(v for v in memory if not math.isnan(v)):.1f} MB",
+    ]
 
-    return reply
 
+def render_book(name: str, title: str, time: str, link: str) -> str:
+    title_match = NAME_PATTERN.search(name)
+    name = title_match.group(0) if title_match else name
+    date = datetime.fromisoformat(time)
+    return f"{name} ({date:%b}-{date.day}):\n{title[:15]}\n{link}"
 
+
+@ttl_cache(seconds=30)
 async def novel_update() -> list[str]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(NOVEL_URL)
+    global novel_etag, novel_reply
+
+    headers: dict[str, str] = {"If-None-Match": novel_etag} if novel_etag else {}
+    response = await http_client.get(NOVEL_URL, headers=headers)
+
+    if response.status_code == 304:
+        return novel_reply
 
     if response.status_code != 200:
         return ["Novel update is not currently available"]
 
-    reply: list[str] = []
+    data_dict: dict[str, list[str]] = response.json()
+
+    # Only books whose entry changed since the last payload are rendered again
+    rendered: dict[str, tuple[tuple[str, ...], str]] = {}
+    for name, entry in data_dict.items():
+        key: tuple[str, ...] = tuple(entry)
+        if (cached := rendered_books.get(name)) is None or cached[0] != key:
+            cached = (key, render_book(name, *entry))
+        rendered[name] = cached
+
+    rendered_books.clear()
+    rendered_books.update(rendered)
+
+    novel_etag = response.headers.get("etag")
+    novel_reply = [line for _, line in rendered.values()]
+    return novel_reply
+
+
+@ttl_cache(seconds=30)
+async def apiserver_status() -> list[str]:
+    assert APISERVER_URL is not None
+
+    responses = await asyncio.gather(
+        *(
+            http_client.get(f"{APISERVER_URL}{path}")
+            for path in ("/sui", "/capital", "/exchange")
+        )
+    )
+
+    if any(response.status_code != 200 for response in responses):
+        return ["Apiserver status is not currently available"]
+
+    sui, *markets = (response.json() for response in responses)
 
-    content: str = response.content.decode("utf-8")
-    data_dict: dict[str, list[str]] = json.loads(content)
+    reply: list[str] = [f"SUI usage: {sui['usage']}", f"SUI online: {sui['online']}"]
 
-    for name, (title, time, link) in data_dict.items():
-        title_match = re.search(r"[^\-－—–,:()\[\]，：（）【】]+", name)
-        name = title_match.group(0) if title_match else name
-        time = datetime.fromisoformat(time)
-        time = time.strftime("%b") + f"-{time.day}"
-        reply.append(f"{name} ({time}):\n{title[:15]}\n{link}")
+    for market in markets:
+        for symbol, price in market.items():
+            if symbol.endswith("_TREND"):
+                continue
+
+            trend: str = market.get(f"{symbol}_TREND", "0")
+            reply.append(f"{symbol:<10} {price:>10} {trend:>6}%")
 
     return reply
 
 
-def restore() -> list[str]:
-    client = docker.DockerClient("unix:///var/run/docker.sock")
-    exited_containers: list[Container] = client.containers.list(
-        all=True, filters={"status": "exited"}
+async def dashboard() -> list[str]:
+    sections: dict[str, Callable[[], Awaitable[list[str]]]] = {
+        "Containers": container_usage,
+        "Novels": novel_update,
+    }
+    if APISERVER_URL is not None:
+        sections["Apiserver"] = apiserver_status
+
+    # Fetch all backends at once so the reply takes as long as the slowest one
+    results = await asyncio.gather(
+        *(fetch() for fetch in sections.values()), return_exceptions=True
     )
-    exited_containers: list[Container] = [
-        container
-        for container in exited_containers
-        if container.attrs["HostConfig"]["RestartPolicy"]["Name"] != "unless-stopped"
-    ]
 
     reply: list[str] = []
+    for name, result in zip(sections, results):
+        reply.append(f"[{name}]")
 
-    for container in exited_containers:
-        container.start()
-        reply.append(f"Restarting container: {container.name}")
+        if isinstance(result, BaseException):
+            logger.error(f"Error {result!r} occurred when fetching {name}")
+            reply.append(f"{name} is not currently available")
+        else:
+            reply.extend(result)
 
-    if not reply:
-        reply.append("No exited containers to restart")
+        reply.append("")
 
     return reply
 
 
+class ProgressMessage:
+    # Telegram rejects frequent edits, so intermediate progress is throttled
+    EDIT_INTERVAL: float = 1.5
+
+    def __init__(self, message: Message) -> None:
+        self.message: Message = message
+        self.text: str = message.text or ""
+        self.last_edit_time: float = 0.0
+
+    async def update(self, reply: list[str]) -> None:
+        if time.monotonic() - self.last_edit_time >= self.EDIT_INTERVAL:
+            await self.edit(default_encode(reply))
+
+    async def finish(self, reply: list[str]) -> None:
+        await self.edit(default_encode(reply))
+
+    async def edit(self, text: str) -> None:
+        if text == self.text:
+            return
+
+        try:
+            await self.message.edit_text(text)
+            self.text = text
+            self.last_edit_time = time.monotonic()
+
+        except TelegramError as e:
+            logger.warning(f"Error {e!r} occurred when editing progress message")
+
+
 def is_authorized(update: Update) -> bool:
     user = update.effective_user
     return user is not None and str(user.id) == TELEBOT_USER_ID
@@ -158,74 +316,261 @@ async def unauthorized_response(update: Update) -> None:
         )
 
 
-async def handle_info_command(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
+CommandBody = Callable[[Update, ContextTypes.DEFAULT_TYPE, Message], Awaitable[None]]
+
+
+def command(
+    name: str, timeout: float = COMMAND_TIMEOUT
+) -> Callable[[CommandBody], Callable[..., Awaitable[None]]]:
+    # Shared authorization, placeholder reply, timeout and latency recording
+    def decorator(body: CommandBody) -> Callable[..., Awaitable[None]]:
+        async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            if not is_authorized(update):
+                await unauthorized_response(update)
+                return
+
+            if update.message is None:
+                return
+
+            start_time: float = time.perf_counter()
+            placeholder: Message = await update.message.reply_text(
+                "Working…", reply_to_message_id=update.message.message_id
+            )
+
+            histogram = command_latencies.setdefault(name, LatencyHistogram())
+
+            try:
+                async with asyncio.timeout(timeout):
+                    await body(update, context, placeholder)
+
+            except TimeoutError:
+                histogram.timeouts += 1
+                logger.warning(f"Command /{name} timed out after {timeout:g} seconds")
+                await placeholder.edit_text(f"/{name} timed out, please try again")
+
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred when handling /{name}")
+                await placeholder.edit_text(f"/{name} failed: {e!r}")
+
+            finally:
+                histogram.record(time.perf_counter() - start_time)
+
+        return handler
+
+    return decorator
+
+
+async def reply_chunks(
+    update: Update, placeholder: Message, chunks: list[str], **kwargs
 ) -> None:
-    if not is_authorized(update):
-        await unauthorized_response(update)
-        return
+    # The first chunk replaces the placeholder, the rest follow as new messages
+    await placeholder.edit_text(chunks[0], **kwargs)
 
-    if update.message is not None:
+    assert update.message is not None
+    for text in chunks[1:]:
         await update.message.reply_text(
-            markdown_v2_encode(await container_usage()),
-            parse_mode="MarkdownV2",
-            reply_to_message_id=update.message.message_id,
+            text, reply_to_message_id=update.message.message_id, **kwargs
         )
 
 
+@command("info")
+async def handle_info_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
+) -> None:
+    await placeholder.edit_text(
+        markdown_v2_encode(await container_usage()), parse_mode="MarkdownV2"
+    )
+
+
+@command("novel")
 async def handle_novel_command(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
 ) -> None:
-    if not is_authorized(update):
-        await unauthorized_response(update)
+    await reply_chunks(
+        update,
+        placeholder,
+        chunk_encode(await novel_update()),
+        link_preview_options=LinkPreviewOptions(is_disabled=True),
+    )
+
+
+@command("dashboard")
+async def handle_dashboard_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
+) -> None:
+    await reply_chunks(
+        update,
+        placeholder,
+        chunk_encode(await dashboard()),
+        link_preview_options=LinkPreviewOptions(is_disabled=True),
+    )
+
+
+@command("history")
+async def handle_history_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
+) -> None:
+    args: list[str] = context.args or []
+
+    try:
+        hours: float = float(args[1]) if len(args) > 1 else 24
+    except ValueError:
+        hours = math.nan
+
+    # NaN fails the range check too, so unparseable hours also get the usage
+    if not args or not 0 < hours <= 7 * 24:
+        await placeholder.edit_text("Usage: /history <container> [hours, up to 168]")
         return
 
-    if update.message is not None:
-        await update.message.reply_text(
-            default_encode(await novel_update()),
-            reply_to_message_id=update.message.message_id,
-            link_preview_options=LinkPreviewOptions(is_disabled=True),
-        )
+    await placeholder.edit_text(
+        markdown_v2_encode(usage_history(args[0], hours)), parse_mode="MarkdownV2"
+    )
 
 
+@command("restore", timeout=RESTORE_TIMEOUT)
 async def handle_restore_command(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
 ) -> None:
-    if not is_authorized(update):
-        await unauthorized_response(update)
-        return
+    progress = ProgressMessage(placeholder)
+    await progress.finish(await restore(progress.update))
 
-    if update.message is not None:
-        await update.message.reply_text(
-            default_encode(restore()),
-            reply_to_message_id=update.message.message_id,
+
+@command("stats")
+async def handle_stats_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder: Message
+) -> None:
+    reply: list[str] = [
+        f"{'Command':<10} {'Count':>5} {'Mean':>6} {'P50':>5} {'P95':>5} {'T/O':>3}"
+    ]
+
+    for name, histogram in sorted(command_latencies.items()):
+        reply.append(
+            f"{name:<10} {histogram.count:>5} {histogram.mean:>5.2f}s "
+            f"{format_bound(histogram.quantile(0.5)):>5} "
+            f"{format_bound(histogram.quantile(0.95)):>5} {histogram.timeouts:>3}"
         )
 
+    # Docker calls that slip onto the loop show up here as stalls
+    lag: dict[tuple[str, ...], float] = monitor.quantiles()
+    reply.append(
+        f"Loop lag p50 {lag[('0.5',)] * 1000:.1f}ms "
+        f"p99 {lag[('0.99',)] * 1000:.1f}ms, {monitor.stalls} stalls"
+    )
+
+    await placeholder.edit_text(markdown_v2_encode(reply), parse_mode="MarkdownV2")
+
 
-def set_commands(app: Application) -> None:
+async def set_commands(app: Application) -> None:
     commands: list[BotCommand] = [
         BotCommand("info", "Get server usage status"),
         BotCommand("novel", "Get novel latest chapters"),
+        BotCommand("history", "Get usage history of a container"),
+        BotCommand("dashboard", "Get server, novel and market status at once"),
         BotCommand("restore", "Restart all exited containers"),
+        BotCommand("stats", "Get command latency statistics"),
     ]
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(app.bot.set_my_commands(commands))
+    await app.bot.set_my_commands(commands)
 
 
-def main() -> None:
+async def timed(name: str, coroutine: Awaitable[None]) -> None:
+    start_time: float = time.perf_counter()
+
+    try:
+        await coroutine
+        duration: float = time.perf_counter() - start_time
+        logger.info(f"{name} finished in {duration:.2f} seconds")
+
+    except Exception as e:
+        logger.error(f"Error {e!r} occurred during {name.lower()}")
+
+
+async def restore_on_startup() -> None:
     # Booting up all containers that were not turned off manually
-    restore()
+    for line in await restore():
+        logger.info(line)
+
+
+async def start_background_services(app: Application, notifier: ChatNotifier) -> None:
+    alert_engine = AlertEngine(parse_rules(ALERT_RULES), notifier.notify)
+    sampler.listeners.append(alert_engine.observe)
+    sampler.start()
+    monitor.start()
+
+    ContainerWatcher(notifier.notify).start()
+
+    await asyncio.gather(
+        timed("Setting commands", set_commands(app)),
+        timed("Restoring containers", restore_on_startup()),
+    )
+
+    duration: float = time.perf_counter() - STARTUP_TIME
+    logger.info(f"Startup finished {duration:.2f} seconds after imports")
+
+
+async def on_startup(app: Application) -> None:
+    notifier = ChatNotifier(app.bot, TELEBOT_USER_ID)
+    notifier.start()
+
+    # Left to run once updates are being received, so commands work right away
+    background_tasks.add(asyncio.create_task(start_background_services(app, notifier)))
 
-    app = Application.builder().token(TELEBOT_TOKEN).build()
+    duration: float = time.perf_counter() - STARTUP_TIME
+    logger.info(f"Bot initialized {duration:.2f} seconds after imports")
+
+
+async def run_webhook(app: Application) -> None:
+    assert WEBHOOK_URL is not None
+
+    stop = asyncio.Event()
+
+    match platform.system():
+        case "Linux":
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+
+        case _:
+            pass
+
+    server = WebhookServer(app, urlparse(WEBHOOK_URL).path or "/", WEBHOOK_SECRET)
+
+    async with app:
+        await on_startup(app)
+        await app.bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await app.start()
+
+        logger.info("Telegram bot started with webhook")
+        await server.serve("0.0.0.0", WEBHOOK_PORT, stop)
+
+        await app.stop()
+
+
+def main() -> None:
+    builder = Application.builder().token(TELEBOT_TOKEN)
+
+    if TELEGRAM_API_URL is not None:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(
+            f"{TELEGRAM_API_URL}/file/bot"
+        )
+
+    # Slow commands no longer hold up the others, up to the worker limit
+    app = builder.concurrent_updates(COMMAND_WORKERS).post_init(on_startup).build()
     app.add_handler(CommandHandler("info", handle_info_command))
     app.add_handler(CommandHandler("novel", handle_novel_command))
+    app.add_handler(CommandHandler("dashboard", handle_dashboard_command))
+    app.add_handler(CommandHandler("history", handle_history_command))
     app.add_handler(CommandHandler("restore", handle_restore_command))
+    app.add_handler(CommandHandler("stats", handle_stats_command))
 
-    set_commands(app)
+    if WEBHOOK_URL is not None:
+        asyncio.run(run_webhook(app))
+        return
 
-    logger.info("Telegram bot started")
+    logger.info("Telegram bot started with polling")
     app.run_polling()
 
 
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger("my_app")
+
+COALESCE_WINDOW: float = 5.0  # Seconds to wait for more alerts before sending
+RETRY_ATTEMPTS: int = 5
+RETRY_BASE_DELAY: float = 2.0
+# Telegram allows about one message per second per chat
+TELEGRAM_MESSAGE_INTERVAL: float = 1.0
+TELEGRAM_MESSAGE_LIMIT: int = 4096
+
+
+# Kept in step with novel/notifier.py
+def build_messages(texts: list[str]) -> list[str]:
+    # Pack as many texts as possible into each message
+    messages: list[str] = []
+    current: str = ""
+
+    for text in texts:
+        text = text[:TELEGRAM_MESSAGE_LIMIT]
+
+        if current and len(current) + len(text) + 2 > TELEGRAM_MESSAGE_LIMIT:
+            messages.append(current)
+            current = ""
+
+        current = f"{current}\n\n{text}" if current else text
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+async def send_with_retry(name: str, post, *args) -> None:
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            await post(*args)
+            return
+
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, int):
+                delay = retry_after
+            else:
+                delay = retry_after.total_seconds()
+
+        except (BadRequest, Forbidden) as e:
+            # Client errors other than rate limiting will not succeed on retry
+            logger.error(f"Error occurred when sending message to {name}: {e!r}")
+            return
+
+        except TelegramError as e:
+            logger.warning(f"Error occurred when sending message to {name}: {e!r}")
+            delay = RETRY_BASE_DELAY * 2**attempt
+
+        await asyncio.sleep(delay)
+
+    logger.error(f"Giving up sending message to {name} after {RETRY_ATTEMPTS} attempts")
+
+
+class ChatNotifier:
+    name = "telegram"
+
+    def __init__(self, bot: Bot, chat_id: str) -> None:
+        self.bot: Bot = bot
+        self.chat_id: str = chat_id
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self.next_message_time: float = 0.0
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    def notify(self, message: str) -> None:
+        self.queue.put_nowait(message)
+
+    async def run(self) -> None:
+        while True:
+            batch: list[str] = [await self.queue.get()]
+
+            # Let alerts raised around the same time join the same message
+            await asyncio.sleep(COALESCE_WINDOW)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            await self.send(list(dict.fromkeys(batch)))
+
+    async def send(self, texts: list[str]) -> None:
+        for message in build_messages(texts):
+            if (delay := self.next_message_time - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+
+            await send_with_retry(self.name, self.post, message)
+            self.next_message_time = time.monotonic() + TELEGRAM_MESSAGE_INTERVAL
+
+    async def post(self, message: str) -> None:
+        await self.bot.send_message(self.chat_id, message)
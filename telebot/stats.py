@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from containers import get_docker_client, run_docker
+from history import UsageHistory
+
+logger = logging.getLogger("my_app")
+
+# Mount the host cgroup v2 hierarchy here to read usage without the Docker API
+CGROUP_ROOT: str = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+CGROUP_PATHS: tuple[str, ...] = (
+    "system.slice/docker-{id}.scope",  # systemd cgroup driver
+    "docker/{id}",  # cgroupfs cgroup driver
+)
+
+SAMPLE_INTERVAL: float = 10.0
+SAMPLE_WINDOW: int = 30  # Five minutes of samples
+
+
+@dataclass(frozen=True)
+class Sample:
+    time: float
+    cpu: float  # Percentage of a single core, same as docker stats
+    memory: int  # Bytes, excluding reclaimable page cache
+
+
+class ContainerStats:
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.samples: deque[Sample] = deque(maxlen=SAMPLE_WINDOW)
+        self.last_usage: tuple[float, int] | None = None  # (time, cpu usec)
+
+    def add(self, now: float, cpu_usage: int, memory: int) -> Sample | None:
+        last_usage, self.last_usage = self.last_usage, (now, cpu_usage)
+
+        # CPU usage is cumulative, so the first reading only sets the baseline
+        if last_usage is None or now <= last_usage[0]:
+            return None
+
+        cpu: float = (cpu_usage - last_usage[1]) / ((now - last_usage[0]) * 1e4)
+        sample = Sample(now, max(cpu, 0.0), memory)
+        self.samples.append(sample)
+        return sample
+
+    @property
+    def current(self) -> Sample | None:
+        return self.samples[-1] if self.samples else None
+
+    @property
+    def cpu_average(self) -> float:
+        return sum(sample.cpu for sample in self.samples) / max(len(self.samples), 1)
+
+    @property
+    def cpu_peak(self) -> float:
+        return max((sample.cpu for sample in self.samples), default=0.0)
+
+    @property
+    def memory_peak(self) -> int:
+        return max((sample.memory for sample in self.samples), default=0)
+
+
+def find_cgroup(container_id: str) -> str | None:
+    for path in CGROUP_PATHS:
+        directory = os.path.join(CGROUP_ROOT, path.format(id=container_id))
+        if os.path.isdir(directory):
+            return directory
+
+    return None
+
+
+def read_cgroup_usage(directory: str) -> tuple[int, int]:
+    cpu_usage: int = 0
+    with open(os.path.join(directory, "cpu.stat")) as file:
+        for line in file:
+            key, value = line.split()
+            if key == "usage_usec":
+                cpu_usage = int(value)
+                break
+
+    with open(os.path.join(directory, "memory.current")) as file:
+        memory: int = int(file.read())
+
+    with open(os.path.join(directory, "memory.stat")) as file:
+        for line in file:
+            key, value = line.split()
+            if key == "inactive_file":
+                memory -= int(value)
+                break
+
+    return cpu_usage, memory
+
+
+def read_docker_usage(container_id: str) -> tuple[int, int]:
+    stats: dict = get_docker_client().api.stats(
+        container_id, stream=False, one_shot=True
+    )
+
+    cpu_usage: int = stats["cpu_stats"]["cpu_usage"]["total_usage"] // 1000
+    memory_stats: dict = stats["memory_stats"]
+    memory: int = memory_stats.get("usage", 0) - memory_stats.get("stats", {}).get(
+        "inactive_file", 0
+    )
+
+    return cpu_usage, memory
+
+
+class StatsSampler:
+    def __init__(self) -> None:
+        self.containers: dict[str, ContainerStats] = {}  # {container id: stats}
+        self.cgroups: dict[str, str | None] = {}  # {container id: cgroup directory}
+        # Keyed by name so history survives containers being recreated
+        self.history: dict[str, UsageHistory] = {}
+        # Called with each new sample, or None when a container stops running
+        self.listeners: list[Callable[[str, Sample | None], None]] = []
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred when sampling container stats")
+
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    async def sample(self) -> None:
+        # The client is resolved in the worker, creating it imports docker and
+        # queries the daemon's version
+        running: list[dict] = await run_docker(
+            lambda: get_docker_client().api.containers()
+        )
+        names: dict[str, str] = {
+            container["Id"]: container["Names"][0].lstrip("/") for container in running
+        }
+
+        for container_id in self.containers.keys() - names.keys():
+            stopped = self.containers.pop(container_id)
+            self.cgroups.pop(container_id, None)
+            self.publish(stopped.name, None)
+
+        for container_id, name in names.items():
+            if container_id not in self.containers:
+                self.containers[container_id] = ContainerStats(name)
+
+        usages = await run_docker(self.read_usages, list(names))
+
+        now: float = time.time()
+
+        for container_id, usage in usages.items():
+            stats = self.containers[container_id]
+
+            if (sample := stats.add(*usage)) is not None:
+                if stats.name not in self.history:
+                    self.history[stats.name] = UsageHistory()
+                self.history[stats.name].add(now, sample.cpu, sample.memory)
+                self.publish(stats.name, sample)
+
+    def publish(self, name: str, sample: Sample | None) -> None:
+        for listener in self.listeners:
+            try:
+                listener(name, sample)
+            except Exception as e:
+                logger.error(f"Error {e!r} occurred in a stats listener for {name}")
+
+    def read_usages(
+        self, container_ids: list[str]
+    ) -> dict[str, tuple[float, int, int]]:
+        usages: dict[str, tuple[float, int, int]] = {}
+
+        for container_id in container_ids:
+            # Probed here on the worker thread, as it touches the filesystem
+            if container_id not in self.cgroups:
+                self.cgroups[container_id] = find_cgroup(container_id)
+
+            try:
+                if (directory := self.cgroups[container_id]) is not None:
+                    usage = read_cgroup_usage(directory)
+                else:
+                    usage = read_docker_usage(container_id)
+
+                usages[container_id] = (time.monotonic(), *usage)
+
+            except Exception as e:
+                logger.debug(f"Error {e!r} occurred when reading {container_id}")
+
+        return usages
+
+    def find_history(self, name: str) -> tuple[str, UsageHistory] | None:
+        if name in self.history:
+            return name, self.history[name]
+
+        matches: list[str] = sorted(n for n in self.history if n.startswith(name))
+        return (matches[0], self.history[matches[0]]) if matches else None
+
+    def snapshot(self) -> list[ContainerStats]:
+        return sorted(
+            (stats for stats in self.containers.values() if stats.current is not None),
+            key=lambda stats: stats.name,
+        )
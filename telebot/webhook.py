@@ -0,0 +1,129 @@
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger("my_app")
+
+SECRET_HEADER: str = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE: int = 1024 * 1024
+READ_TIMEOUT: float = 60.0  # Idle keep-alive connections are closed after this
+
+RESPONSES: dict[int, bytes] = {
+    200: b"OK",
+    400: b"Bad Request",
+    403: b"Forbidden",
+    404: b"Not Found",
+    405: b"Method Not Allowed",
+    413: b"Payload Too Large",
+}
+
+
+class BadRequest(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(RESPONSES[status].decode())
+        self.status = status
+
+
+# Minimal HTTP/1.1 endpoint that hands Telegram updates to the application
+class WebhookServer:
+    def __init__(self, app: Application, path: str, secret: str) -> None:
+        self.app: Application = app
+        self.path: str = path
+        self.secret: bytes = secret.encode()
+
+    async def serve(self, host: str, port: int, stop: asyncio.Event) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+        async with server:
+            await stop.wait()
+
+            # Idle keep-alive connections would otherwise hold up the shutdown
+            server.close()
+            server.close_clients()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # Telegram keeps connections alive, so serve requests until it closes
+            while True:
+                try:
+                    status, keep_alive = await asyncio.wait_for(
+                        self.handle_request(reader), READ_TIMEOUT
+                    )
+                except BadRequest as e:
+                    status, keep_alive = e.status, False
+
+                if status == 0:
+                    break
+
+                head: str = (
+                    f"HTTP/1.1 {status} {RESPONSES[status].decode()}\r\n"
+                    f"Content-Length: {len(RESPONSES[status])}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode() + RESPONSES[status])
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        except Exception as e:
+            logger.error(f"Error {e!r} occurred in the webhook server")
+
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader: asyncio.StreamReader) -> tuple[int, bool]:
+        request_line: bytes = await reader.readline()
+        if not request_line:
+            return 0, False
+
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise BadRequest(400)
+
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        try:
+            length: int = int(headers.get("content-length") or "0")
+        except ValueError:
+            raise BadRequest(400)
+
+        if length > MAX_BODY_SIZE:
+            raise BadRequest(413)
+
+        body: bytes = await reader.readexactly(length)
+        keep_alive: bool = headers.get("connection", "").lower() != "close"
+
+        if target.split("?", 1)[0] != self.path:
+            return 404, keep_alive
+        if method != "POST":
+            return 405, keep_alive
+        if not hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), self.secret
+        ):
+            logger.warning("Rejected a webhook request with a wrong secret token")
+            return 403, keep_alive
+
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except Exception as e:
+            logger.warning(f"Error {e!r} occurred when parsing a webhook update")
+            return 400, keep_alive
+
+        # Answer right away, the application processes the update on its own
+        await self.app.update_queue.put(update)
+        return 200, keep_alive
@@ -5,12 +5,20 @@ from functools import partial
 from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from httpx import AsyncClient
-from uvicorn import Config, Server
+from uvicorn import Config
+
+from loop_monitor import monitor
+from metrics import MetricsMiddleware, loop_endpoint, metrics_endpoint
+from profiler import profile_endpoint, register_profile_signal
+from proxy import ReverseProxy
+from shutdown import DrainingServer, DrainMiddleware, ShutdownCoordinator
 
 REQUEST_METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH"]
 app = FastAPI()
-client = AsyncClient()
+coordinator = ShutdownCoordinator()
+app.add_middleware(DrainMiddleware, coordinator=coordinator)
+app.add_middleware(MetricsMiddleware)
+proxy = ReverseProxy("http://example.com")
 last_updated_time: float = time.time()
 
 NO_CACHE_HEADER = {
@@ -39,31 +47,46 @@ def depends_checker(request: Request) -> None:
 
 
 async def http_route(request: Request, tail: str, arg: str) -> Response:
-    forwarded_request = client.build_request(
-        method=request.method,
-        url="example.com",
-        headers=dict(request.headers),
-        content=await request.body(),
-        params=request.query_params,
-    )
+    # Bodies stream through in both directions instead of being buffered
+    return await proxy.forward(request, f"/{tail}", route=arg)
 
-    forwarded_response = await client.send(forwarded_request)
 
-    return Response(
-        content=await forwarded_response.aread(),
-        status_code=forwarded_response.status_code,
-        headers=dict(forwarded_response.headers),
-    )
+async def proxy_stats() -> JSONResponse:
+    return JSONResponse(content=proxy.snapshot(), headers=NO_CACHE_HEADER)
 
 
 def add_api_routes() -> None:
     app.add_api_route(
-        path="/http/{{tail:path}}",
+        path="/http/{tail:path}",
         endpoint=partial(http_route, arg="arg1"),
         dependencies=[Depends(depends_checker)],
         methods=REQUEST_METHODS,
     )
 
+    app.add_api_route(
+        path="/metrics",
+        endpoint=metrics_endpoint,
+        dependencies=[Depends(depends_checker)],
+    )
+
+    app.add_api_route(
+        path="/debug/loop",
+        endpoint=loop_endpoint,
+        dependencies=[Depends(depends_checker)],
+    )
+
+    app.add_api_route(
+        path="/debug/profile",
+        endpoint=profile_endpoint,
+        dependencies=[Depends(depends_checker)],
+    )
+
+    app.add_api_route(
+        path="/proxy/stats",
+        endpoint=proxy_stats,
+        dependencies=[Depends(depends_checker)],
+    )
+
     app.mount(
         "/",
         StaticFiles(directory="/website", html=True),
@@ -72,10 +95,12 @@ def add_api_routes() -> None:
 
 async def start_api_server() -> None:
     config = Config(app=app, host="0.0.0.0", port=80, log_level="critical")
-    await Server(config).serve()
+    await DrainingServer(config, coordinator).serve()
 
 
 async def main() -> None:
+    monitor.start()
+    register_profile_signal()
     add_api_routes()
 
     await start_api_server()
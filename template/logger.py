@@ -1,31 +1,119 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
-console_logger = logging.getLogger("my_app")
-console_logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-formatter = logging.Formatter(
+# Handlers run on a listener thread, so slow stdout or disks never block the loop
+LOG_QUEUE_SIZE: int = 10000
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+
+TEXT_FORMATTER = logging.Formatter(
     fmt="%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
 )
-console_handler.setFormatter(formatter)
-console_logger.addHandler(console_handler)
-console_logger.propagate = False
 
 
-file_logger = logging.getLogger("custom_logger")
-file_logger.setLevel(logging.INFO)
-handler = TimedRotatingFileHandler("log.log", when="W0", backupCount=4)
-formatter = logging.Formatter("%(asctime)s - %(message)s", "%Y-%m-%d %H:%M:%S")
-handler.setFormatter(formatter)
-file_logger.addHandler(handler)
-file_logger.propagate = False
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line for log collectors
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, str | float] = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # A full queue drops records instead of blocking the caller
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped: int = 0
+        self.reported: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is merged here, tracebacks are formatted by the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        if self.dropped != self.reported:
+            count: int = self.dropped - self.reported
+            self.reported = self.dropped
+            warning = logging.makeLogRecord(
+                {
+                    "name": record.name,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {count} log records on a full queue",
+                }
+            )
+
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                pass
+
 
+queue_handlers: list[DroppingQueueHandler] = []
 
-def some_function() -> None:
-    pass
 
+def setup_logger(
+    name: str,
+    handler: logging.Handler | None = None,
+    level: int = logging.INFO,
+    json_lines: bool = LOG_FORMAT == "json",
+) -> logging.Logger:
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter() if json_lines else TEXT_FORMATTER)
 
-__all__ = ["some_function"]
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handlers.append(queue_handler)
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    # Records still queued are written out before the interpreter exits
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    return logger
+
+
+def dropped_records() -> int:
+    return sum(handler.dropped for handler in queue_handlers)
+
+
+__all__ = ["setup_logger", "dropped_records"]
 
 if __name__ == "__main__":
+    console_logger = setup_logger("my_app")
+
+    file_handler = TimedRotatingFileHandler("log.log", when="W0", backupCount=4)
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(message)s", "%Y-%m-%d %H:%M:%S")
+    )
+    file_logger = setup_logger("custom_logger", handler=file_handler)
+
+    console_logger.info("This record is written by the listener thread.")
     file_logger.info("This record should only be written to the log file.")
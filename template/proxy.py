@@ -0,0 +1,176 @@
+import logging
+import math
+import time
+from collections.abc import AsyncIterator
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from httpx import URL, AsyncClient, Limits, Timeout, TimeoutException, TransportError
+from starlette.background import BackgroundTask
+
+from metrics import Histogram, registry
+
+logger = logging.getLogger("my_app")
+
+proxy_seconds = registry.histogram(
+    "proxy_request_seconds", "Proxied request duration by route", ("route",)
+)
+proxy_errors = registry.counter(
+    "proxy_errors_total", "Proxied requests that failed upstream", ("route",)
+)
+
+# Only meaningful for a single connection, so never forwarded (RFC 9110 7.6.1)
+HOP_BY_HOP_HEADERS: frozenset[str] = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "proxy-connection",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+    }
+)
+
+
+def filter_headers(headers: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    # Headers listed in Connection are hop-by-hop for this message as well
+    dropped: set[str] = set(HOP_BY_HOP_HEADERS)
+    for key, value in headers:
+        if key.lower() == "connection":
+            dropped.update(token.strip().lower() for token in value.split(","))
+
+    return [(key, value) for key, value in headers if key.lower() not in dropped]
+
+
+def finite(seconds: float) -> float | None:
+    return None if math.isinf(seconds) else seconds
+
+
+class ReverseProxy:
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        preserve_host: bool = False,
+    ) -> None:
+        # Waiting for a free pooled connection counts against the connect timeout
+        self.client = AsyncClient(
+            base_url=base_url,
+            limits=Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+            ),
+            timeout=Timeout(
+                read_timeout, connect=connect_timeout, pool=connect_timeout
+            ),
+        )
+        self.preserve_host: bool = preserve_host
+        self.routes: set[str] = set()
+
+    async def forward(self, request: Request, path: str, route: str) -> Response:
+        self.routes.add(route)
+        latency: Histogram = proxy_seconds.labels(route)
+        start_time: float = time.perf_counter()
+
+        headers = filter_headers(request.headers.items())
+        if not self.preserve_host:
+            headers = [(key, value) for key, value in headers if key.lower() != "host"]
+
+        if request.client is not None:
+            headers.append(("x-forwarded-for", request.client.host))
+        headers.append(("x-forwarded-proto", request.url.scheme))
+
+        # Bodies are streamed through, requests without one must not turn chunked
+        has_body: bool = (
+            "content-length" in request.headers
+            or "transfer-encoding" in request.headers
+        )
+
+        forwarded_request = self.client.build_request(
+            method=request.method,
+            url=URL(path, query=request.url.query.encode()),
+            headers=headers,
+            content=request.stream() if has_body else None,
+        )
+
+        try:
+            forwarded_response = await self.client.send(forwarded_request, stream=True)
+
+        except TimeoutException as e:
+            latency.observe(time.perf_counter() - start_time)
+            proxy_errors.labels(route).inc()
+            logger.warning(f"Upstream timed out for {route}: {e!r}")
+            return JSONResponse({"message": "Gateway Timeout"}, status_code=504)
+
+        except TransportError as e:
+            latency.observe(time.perf_counter() - start_time)
+            proxy_errors.labels(route).inc()
+            logger.warning(f"Upstream unreachable for {route}: {e!r}")
+            return JSONResponse({"message": "Bad Gateway"}, status_code=502)
+
+        failed: bool = forwarded_response.status_code >= 500
+        finished: bool = False
+
+        async def finish() -> None:
+            # Runs when the relay ends and again as the background task, which
+            # also covers a stream that was cancelled before it ever started
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+
+            await forwarded_response.aclose()
+            latency.observe(time.perf_counter() - start_time)
+            if failed:
+                proxy_errors.labels(route).inc()
+
+        async def relay() -> AsyncIterator[bytes]:
+            # Raw bytes keep the upstream encoding, so nothing is decompressed here
+            nonlocal failed
+            try:
+                async for chunk in forwarded_response.aiter_raw():
+                    yield chunk
+
+            except Exception as e:
+                failed = True
+                logger.warning(f"Upstream stream broke for {route}: {e!r}")
+                raise
+
+            finally:
+                await finish()
+
+        response = StreamingResponse(
+            relay(),
+            status_code=forwarded_response.status_code,
+            background=BackgroundTask(finish),
+        )
+        response.raw_headers = [
+            (key.encode("latin-1"), value.encode("latin-1"))
+            for key, value in filter_headers(forwarded_response.headers.multi_items())
+        ]
+        return response
+
+    def snapshot(self) -> dict[str, dict[str, float | None]]:
+        result: dict[str, dict[str, float | None]] = {}
+
+        for route in self.routes:
+            latency: Histogram = proxy_seconds.labels(route)
+            count: int = latency.count
+            result[route] = {
+                "requests": count,
+                "errors": proxy_errors.labels(route).value,
+                "mean": latency.sum / count if count else 0.0,
+                "p50": finite(latency.quantile(0.5)),
+                "p99": finite(latency.quantile(0.99)),
+            }
+
+        return result
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -3,6 +3,8 @@ import time
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from jobs import add_job
+
 
 def synchronized_task(arg1: int, arg2: str) -> None:
     time.sleep(10)
@@ -15,14 +17,17 @@ async def async_task(arg1: int, arg2: str) -> None:
 def schedule_tasks() -> None:
     scheduler = AsyncIOScheduler()
 
-    scheduler.add_job(
+    # Runs on the bounded job thread pool instead of blocking the event loop
+    add_job(
+        scheduler,
         synchronized_task,
         "interval",
         hours=8,
         args=(1, "1"),
     )
 
-    scheduler.add_job(
+    add_job(
+        scheduler,
         async_task,
         "cron",
         hour="5,10",
@@ -2,29 +2,37 @@ import asyncio
 import platform
 import signal
 
+# Uvicorn services use DrainingServer from shutdown.py, which already handles
+# SIGTERM by draining connections before running the shutdown callbacks
+
 
 def handle_termination_signal(signum, frame) -> None:
     print("Exiting")
     raise SystemExit(0)
 
 
-def handle_termination_signal_async() -> None:
-    print("Exiting")
-    raise SystemExit(0)
+async def some_work(stop: asyncio.Event) -> None:
+    # Long running work checks the event instead of being cut off mid-way
+    while not stop.is_set():
+        await asyncio.sleep(1)
 
 
 async def main() -> None:
+    stop = asyncio.Event()
+
     match platform.system():
         case "Linux":
             signal.signal(signal.SIGTERM, handle_termination_signal)
 
-            asyncio.get_running_loop().add_signal_handler(
-                signal.SIGTERM, handle_termination_signal_async
-            )
+            # Overrides the handler above once the loop is running
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
         case _:
             pass
 
-    await asyncio.sleep(60)
+    await some_work(stop)
+
+    # Flush state here, then return normally
+    print("Exiting")
 
 
 if __name__ == "__main__":
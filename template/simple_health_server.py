@@ -1,40 +1,91 @@
-import http.server
-import socketserver
+import asyncio
 import threading
 import time
 
-lastUpdatedTime: float = time.time()
+HEALTH_TIMEOUT: float = 60.0  # Unhealthy when no beat arrived for this long
+CONNECTION_TIMEOUT: float = 5.0  # Slow or half-open probers are dropped after this
+MAX_LINE_SIZE: int = 8 * 1024
 
+last_beat: float = time.time()
 
-class HealthCheckHandler(http.server.BaseHTTPRequestHandler):
-    def log_message(self, format, *args) -> None:
-        # Override the log_message method to do nothing
+
+def beat() -> None:
+    # Called by the worker whenever it makes progress
+    global last_beat
+    last_beat = time.time()
+
+
+def build_response(status: int, reason: str, body: bytes) -> bytes:
+    return (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    ).encode() + body
+
+
+async def read_request_path(reader: asyncio.StreamReader) -> str:
+    request_line: bytes = await reader.readline()
+
+    # Headers are not needed, but are read so the prober sees a clean close
+    while await reader.readline() not in (b"\r\n", b"\n", b""):
         pass
 
-    def do_GET(self) -> None:
-        if self.path == "/health":
-            if (time.time() - lastUpdatedTime) > 60:
-                self.send_response(500)
-            else:
-                self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
+    parts: list[str] = request_line.decode("latin-1").split()
+    return parts[1] if len(parts) >= 2 else ""
+
+
+async def handle_connection(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        path: str = await asyncio.wait_for(
+            read_request_path(reader), CONNECTION_TIMEOUT
+        )
+
+        if path != "/health":
+            response = build_response(404, "Not Found", b'{"message":"Not Found"}')
+        elif time.time() - last_beat > HEALTH_TIMEOUT:
+            response = build_response(
+                500, "Internal Server Error", b'{"message":"ERROR"}'
+            )
         else:
-            self.send_response(404)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(b"Not Found")
+            response = build_response(200, "OK", b'{"message":"OK"}')
+
+        writer.write(response)
+        await asyncio.wait_for(writer.drain(), CONNECTION_TIMEOUT)
+
+    except (TimeoutError, ConnectionError, ValueError):
+        pass
+
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "0.0.0.0", port: int = 80) -> None:
+    # Every connection is its own task, so one stuck prober cannot block the rest
+    server = await asyncio.start_server(
+        handle_connection, host, port, limit=MAX_LINE_SIZE
+    )
+
+    async with server:
+        await server.serve_forever()
 
 
-def start_api_server() -> None:
-    with socketserver.TCPServer(("0.0.0.0", 80), HealthCheckHandler) as httpd:
-        httpd.serve_forever()
+def start_api_server() -> threading.Thread:
+    # For synchronous workers, run the server on its own event loop
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    return thread
 
 
 if __name__ == "__main__":
-    threading.Thread(target=start_api_server, daemon=True).start()
+    # Asynchronous services can run asyncio.create_task(serve()) instead
+    start_api_server()
 
     print("API server started on port 80")
 
     while True:
         time.sleep(10)
+        beat()